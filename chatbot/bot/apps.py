@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class BotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bot'
+
+    def ready(self):
+        # 🔥 Load the catalog + indexes now, not on the first Dialogflow call
+        from bot.warmup import should_warm_up, start_warmup
+        if should_warm_up():
+            start_warmup()
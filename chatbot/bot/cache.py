@@ -0,0 +1,96 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Common Roman Urdu / chat spelling variants mapped to one form, so
+# "price kia he" and "Price kya hai?" share a cache entry.
+SPELLING_VARIANTS = {
+    "kia": "kya", "kiya": "kya", "kyaa": "kya",
+    "he": "hai", "hay": "hai", "hy": "hai", "hain": "hai", "hein": "hai", "hen": "hai",
+    "muje": "mujhe", "mujhy": "mujhe", "mujhay": "mujhe", "mjhe": "mujhe",
+    "chahye": "chahiye", "chaiye": "chahiye", "chahiay": "chahiye", "chahie": "chahiye",
+    "kitne": "kitna", "kitnay": "kitna", "kitni": "kitna",
+    "qeemat": "price", "qimat": "price", "keemat": "price", "kimat": "price", "daam": "price", "prices": "price",
+    "dilivery": "delivery", "delievery": "delivery", "delivry": "delivery",
+    "charges": "charge", "charjes": "charge", "charj": "charge",
+    "shoe": "shoes", "joote": "shoes", "joota": "shoes", "jootay": "shoes", "jutay": "shoes", "juta": "shoes",
+    "dikhaen": "dikhao", "dikhayen": "dikhao", "dikha": "dikhao",
+    "plz": "please", "pls": "please",
+}
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_query(text):
+    """Lowercase, drop punctuation/extra spaces and unify spelling variants"""
+    words = WORD_RE.findall((text or "").lower())
+    return " ".join(SPELLING_VARIANTS.get(w, w) for w in words)
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize=1024, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class AnswerCache(TTLCache):
+    """LLM reply cache keyed on normalized query, price range, product set and catalog version"""
+
+    def __init__(self, maxsize=1024, ttl=600):
+        super().__init__(maxsize, ttl)
+        self.catalog_version = None
+
+    def make_key(self, user_query, products, catalog_version, price_range=(None, None)):
+        # Entries from an older catalog can never hit again, drop them at once
+        if catalog_version != self.catalog_version:
+            self.clear()
+            self.catalog_version = catalog_version
+        product_ids = tuple(getattr(p, "pk", None) or p.title for p in products)
+        return (normalize_query(user_query), tuple(price_range), hash(product_ids), catalog_version)
@@ -0,0 +1,199 @@
+import os
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from bot.columnar import load_catalog_file
+from bot.facets import FacetIndex
+from bot.knowledge import KnowledgeBase, PassageIndex, extract_site_facts, split_pages
+from bot.models import Product
+from bot.search import PriceIndex, ProductIndex, VectorRanker
+
+
+def catalog_version_path():
+    return getattr(settings, "CATALOG_VERSION_FILE", settings.BASE_DIR / "catalog_version.txt")
+
+
+def bump_catalog_version(version=None):
+    """Write a new catalog version marker (called by scrape_products after a refresh)"""
+    version = version or str(time.time_ns())
+    path = catalog_version_path()
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp, path)  # atomic, readers never see a half-written marker
+    return version
+
+
+def get_catalog_version():
+    """Current catalog version marker ("0" if the scraper never wrote one)"""
+    try:
+        with open(catalog_version_path(), "r", encoding="utf-8") as f:
+            return f.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+
+
+def load_knowledge_sections():
+    """[(page, section, text)] from the compacted knowledge base, or the raw pages file"""
+    # Prefer the compacted knowledge base, the raw file is mostly navigation chrome
+    knowledge = KnowledgeBase.load()
+    if knowledge is not None:
+        return list(knowledge.iter_sections())
+    path = getattr(settings, "PAGES_CONTENT_FILE", settings.BASE_DIR / "pages_content.txt")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return [(url, "content", text) for url, text in split_pages(f.read()).items()]
+    return []
+
+
+class TitleRow:
+    """Just a title, for building facets without loading full products"""
+
+    __slots__ = ("title",)
+
+    def __init__(self, title):
+        self.title = title
+
+
+class CatalogSnapshot:
+    """Immutable view of the catalog: products, brands, page passages and search indexes.
+
+    A snapshot is fully built before it is published, so a request holding one
+    never sees a half-built index even while a newer snapshot is loading.
+    """
+
+    __slots__ = (
+        "version", "products", "brands", "facets", "passages", "facts", "search_index", "ranker",
+        "price_index", "built_at",
+    )
+
+    def __init__(self, version, products, knowledge_sections, titles=None):
+        self.version = version
+        self.products = tuple(products)
+        # Brands/models for the prompt; from titles alone when products stay in the database
+        self.facets = FacetIndex(self.products if titles is None else [TitleRow(t) for t in titles])
+        self.brands = self.facets.brands
+        self.passages = PassageIndex(knowledge_sections)
+        self.facts = extract_site_facts(knowledge_sections)
+        self.search_index = ProductIndex(self.products)
+        self.ranker = VectorRanker(self.products)
+        self.price_index = PriceIndex(self.products)
+        self.built_at = time.time()
+
+    def pages_content(self, user_query="", budget=None):
+        """Website passages relevant to the query, within the prompt character budget"""
+        if budget is None:
+            budget = getattr(settings, "KNOWLEDGE_PROMPT_BUDGET", 1200)
+        return self.passages.context(user_query, budget=budget, k=getattr(settings, "KNOWLEDGE_TOP_K", 5))
+
+    @classmethod
+    def load(cls, version):
+        if getattr(settings, "PRODUCT_SEARCH_MODE", "memory") == "db":
+            # Product search runs in the database; keep only titles for the brand facets
+            titles = Product.objects.values_list("title", flat=True)
+            return cls(version, (), load_knowledge_sections(), titles=titles)
+        # Prefer the scraper's memory-mapped columnar file over building model instances
+        rows = load_catalog_file(version)
+        if rows is None:
+            rows = Product.objects.all()
+        return cls(version, rows, load_knowledge_sections())
+
+
+def snapshot_path():
+    return os.path.abspath(getattr(settings, "CATALOG_SNAPSHOT_FILE", settings.BASE_DIR / "catalog_snapshot.pkl"))
+
+
+def save_snapshot(snapshot, path=None):
+    """Pickle a built snapshot (indexes included) so workers can load it instead of rebuilding"""
+    path = path or snapshot_path()
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return path
+
+
+def load_snapshot(version, path=None):
+    """Prebuilt snapshot for this catalog version, or None (missing, stale or unreadable).
+
+    Only ever load files written by our own scraper: unpickling runs code.
+    """
+    path = path or snapshot_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except Exception:
+        # Stale columnar file behind the pickled rows, or an artifact from older code
+        return None
+    if not isinstance(snapshot, CatalogSnapshot) or snapshot.version != version:
+        return None
+    return snapshot
+
+
+def build_snapshot(version):
+    """Prebuilt artifact if the scraper left one for this version, otherwise build from files/DB"""
+    if getattr(settings, "PRODUCT_SEARCH_MODE", "memory") == "db":
+        return CatalogSnapshot.load(version)  # the artifact carries in-memory product indexes
+    return load_snapshot(version) or CatalogSnapshot.load(version)
+
+
+class CatalogManager:
+    """Holds the current snapshot and swaps in a rebuilt one when the version marker changes"""
+
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self.snapshot = None
+        self._next_check = 0
+        self._build_lock = threading.Lock()
+        self._reloading = False
+        self.reloads = 0
+
+    def get(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            return self._load_now()
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            version = get_catalog_version()
+            if version != snapshot.version and not self._reloading:
+                self._reloading = True
+                threading.Thread(target=self._reload, args=(version,), daemon=True).start()
+        return snapshot
+
+    def _load_now(self):
+        # First request on a cold worker: build inline, once
+        with self._build_lock:
+            if self.snapshot is None:
+                self.snapshot = build_snapshot(get_catalog_version())
+                self._next_check = time.monotonic() + self.check_interval
+        return self.snapshot
+
+    def _reload(self, version):
+        try:
+            with self._build_lock:
+                snapshot = build_snapshot(version)
+                self.snapshot = snapshot  # atomic swap
+                self.reloads += 1
+        finally:
+            self._reloading = False
+            connection.close()
+
+    def invalidate(self):
+        """Drop the snapshot so the next request rebuilds it"""
+        with self._build_lock:
+            self.snapshot = None
+
+
+CATALOG = CatalogManager(check_interval=getattr(settings, "CATALOG_CHECK_INTERVAL", 5))
+
+
+def get_catalog():
+    """Current catalog snapshot (reloaded in the background after scrape_products)"""
+    return CATALOG.get()
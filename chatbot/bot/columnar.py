@@ -0,0 +1,160 @@
+import json
+import mmap
+import os
+import struct
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+
+MAGIC = b"RTCAT\x00\x01\x00"
+HEADER = struct.Struct("<8sQ")  # magic, JSON header length
+ALIGN = 8
+STRING_FIELDS = ("title", "image_url", "product_link")
+
+
+def catalog_file_path():
+    # Absolute, because the path is also baked into pickled snapshots (see __reduce__)
+    return os.path.abspath(getattr(settings, "CATALOG_FILE", settings.BASE_DIR / "catalog.bin"))
+
+
+def _pad(size):
+    return -size % ALIGN
+
+
+def write_catalog_file(rows, version, path=None):
+    """Write (id, title, price, image_url, product_link) rows as one columnar file.
+
+    Layout: magic + JSON header, then 8-byte aligned columns: ids (int64),
+    prices in paisa (int64), and per string field an offsets array (uint64,
+    n + 1 entries) plus the UTF-8 blob it indexes.
+    """
+    path = path or catalog_file_path()
+    rows = list(rows)
+    columns = {
+        "id": np.array([r[0] for r in rows], dtype=np.int64),
+        "price": np.array([int(round(Decimal(r[2]) * 100)) for r in rows], dtype=np.int64),
+    }
+    for field, idx in zip(STRING_FIELDS, (1, 3, 4)):
+        encoded = [(r[idx] or "").encode("utf-8") for r in rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.uint64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        columns[f"{field}_offsets"] = offsets
+        columns[f"{field}_blob"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    # Column offsets are relative to the (aligned) end of the header
+    layout, offset = {}, 0
+    for name, array in columns.items():
+        layout[name] = {"offset": offset, "dtype": array.dtype.str, "length": len(array)}
+        offset += array.nbytes + _pad(array.nbytes)
+    header = json.dumps({"version": version, "count": len(rows), "columns": layout}).encode("utf-8")
+    header += b" " * _pad(HEADER.size + len(header))
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        for array in columns.values():
+            f.write(array.tobytes())
+            f.write(b"\0" * _pad(array.nbytes))
+    os.replace(tmp, path)  # workers still mapping the old file keep their pages
+    return path
+
+
+class ProductRow:
+    """Read-only view of one product in a ColumnarCatalog (what the indexes need from Product)"""
+
+    __slots__ = ("_catalog", "_idx")
+
+    def __init__(self, catalog, idx):
+        self._catalog = catalog
+        self._idx = idx
+
+    @property
+    def pk(self):
+        return int(self._catalog.ids[self._idx])
+
+    id = pk
+
+    @property
+    def price(self):
+        return Decimal(int(self._catalog.prices[self._idx])).scaleb(-2)
+
+    @property
+    def title(self):
+        return self._catalog.string("title", self._idx)
+
+    @property
+    def image_url(self):
+        return self._catalog.string("image_url", self._idx)
+
+    @property
+    def product_link(self):
+        return self._catalog.string("product_link", self._idx)
+
+    def __str__(self):
+        return self.title
+
+    def __repr__(self):
+        return f"<ProductRow: {self.title}>"
+
+
+class ColumnarCatalog:
+    """Memory-mapped catalog file: NumPy views over shared pages, strings decoded on access"""
+
+    def __init__(self, path, expect_version=None):
+        self.path = os.path.abspath(path)
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a catalog file: {path}")
+        header = json.loads(bytes(self._mm[HEADER.size:HEADER.size + header_len]))
+        self.version = header["version"]
+        if expect_version is not None and self.version != expect_version:
+            raise ValueError(f"{path} holds catalog {self.version}, not {expect_version}")
+        self.count = header["count"]
+        base = HEADER.size + header_len
+        self.columns = {
+            name: np.frombuffer(self._mm, dtype=np.dtype(col["dtype"]), count=col["length"],
+                                offset=base + col["offset"])
+            for name, col in header["columns"].items()
+        }
+        self.ids = self.columns["id"]
+        self.prices = self.columns["price"]  # paisa
+
+    def __reduce__(self):
+        # Pickled snapshots re-map the file instead of copying it, and only the same version
+        return ColumnarCatalog, (self.path, self.version)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [ProductRow(self, i) for i in range(*idx.indices(self.count))]
+        if idx < 0:
+            idx += self.count
+        if not 0 <= idx < self.count:
+            raise IndexError(idx)
+        return ProductRow(self, idx)
+
+    def __iter__(self):
+        return (ProductRow(self, i) for i in range(self.count))
+
+    def string(self, field, idx):
+        offsets = self.columns[f"{field}_offsets"]
+        start, end = int(offsets[idx]), int(offsets[idx + 1])
+        return self.columns[f"{field}_blob"][start:end].tobytes().decode("utf-8")
+
+
+def load_catalog_file(version, path=None):
+    """ColumnarCatalog for this catalog version, or None if the file is missing or from another version"""
+    path = path or catalog_file_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        catalog = ColumnarCatalog(path)
+    except (OSError, ValueError):
+        return None
+    return catalog if catalog.version == version else None
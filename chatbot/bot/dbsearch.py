@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Q
+
+from bot.facets import BRAND_ALIASES, query_brands
+from bot.models import Product
+from bot.search import query_words
+
+FTS_TABLE = "bot_product_fts"
+_FTS_AVAILABLE = None
+
+
+def product_search_mode():
+    """"memory" (catalog snapshot indexes) or "db" (FTS5 / indexed queries per request)"""
+    return getattr(settings, "PRODUCT_SEARCH_MODE", "memory")
+
+
+def fts_available():
+    """Whether the FTS5 title table from migration 0002 exists"""
+    global _FTS_AVAILABLE
+    if _FTS_AVAILABLE is None:
+        _FTS_AVAILABLE = connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names()
+    return _FTS_AVAILABLE
+
+
+def fts_match(query):
+    """FTS5 MATCH expression: any query word as a prefix ("nik" finds "nike"), plus brand aliases.
+
+    Stopwords and filler are dropped first; a filler-only query has no MATCH.
+    """
+    words = [w for w in query_words(query) if len(w) >= 2]
+    terms = [f'"{w}"*' for w in words]
+    for brand in sorted(query_brands(words)):
+        # The store writes "NK" / "Adii" in titles; aliases match whole words only
+        terms.extend(f'"{alias}"' for alias in BRAND_ALIASES[brand] if alias not in words)
+    return " OR ".join(dict.fromkeys(terms))
+
+
+def price_filter(low, high):
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lte=high)
+    return q
+
+
+def search_products(query, limit=10, low=None, high=None):
+    """Title search in the database (FTS5 bm25 on SQLite), optionally within a price range"""
+    match = fts_match(query)
+    if not match:
+        return []
+    if fts_available():
+        sql = [
+            f"SELECT p.* FROM {FTS_TABLE} JOIN bot_product p ON p.id = {FTS_TABLE}.rowid",
+            f"WHERE {FTS_TABLE} MATCH %s",
+        ]
+        params = [match]
+        if low is not None:
+            sql.append("AND p.price >= %s")
+            params.append(low)
+        if high is not None:
+            sql.append("AND p.price <= %s")
+            params.append(high)
+        sql.append(f"ORDER BY bm25({FTS_TABLE}) LIMIT %s")
+        params.append(limit)
+        try:
+            return list(Product.objects.raw(" ".join(sql), params))
+        except DatabaseError:
+            pass  # malformed MATCH expression, use the plain filter below
+
+    words = Q()
+    for word in query_words(query):
+        words |= Q(title__icontains=word)
+    return list(Product.objects.filter(words, price_filter(low, high)).order_by("price")[:limit])
+
+
+def products_in_price_range(low=None, high=None, limit=5):
+    """Same order as PriceIndex.between(), served by the price index"""
+    order = "-price" if low is None and high is not None else "price"
+    return list(Product.objects.filter(price_filter(low, high)).order_by(order, "id")[:limit])
+
+
+def sample_products(limit):
+    """First `limit` products by id (prompt padding when the search finds nothing)"""
+    return list(Product.objects.order_by("id")[:limit])
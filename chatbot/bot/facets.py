@@ -0,0 +1,184 @@
+import re
+from collections import Counter, defaultdict
+
+from bot.search import tokenize
+
+# Title word -> canonical brand. The store abbreviates and misspells brand
+# names on purpose ("Adii", "NK", "Aiirmaxx"), so these are matched per word.
+BRAND_ALIASES = {
+    "Adidas": ["ad", "adii", "adidas", "adi", "yeezy", "yeeezzzy", "yeeezzyy", "samba", "ultraboost",
+               "pureboost", "nmd", "terrex", "adilette"],
+    "Nike": ["nk", "nike", "af", "af1", "aiir", "aiirmaxx", "aiirmaxx90", "airmax", "airforce", "winflo",
+             "wiinflo", "winflow", "joyride", "joyriide", "zoomx", "pegasus", "naf", "adapt", "dunk", "uptempo"],
+    "Jordan": ["aj", "jordan", "aj1"],
+    "New Balance": ["nb", "newbalance"],
+    "Skechers": ["skechers", "skecherrs", "skecher", "sketch", "sk"],
+    "Hoka": ["hoka", "hk", "clifton", "bondi", "rincon"],
+    "Gucci": ["gucci"],
+    "Balmain": ["balmain"],
+    "Converse": ["converse"],
+    "Tommy Hilfiger": ["th", "tommy", "hilfiger"],
+    "Asics": ["asics", "novablast", "keyano"],
+    "Adda": ["adda"],
+    "Lo-Vi": ["lo", "lovi"],
+}
+# Brand names of two words, matched on adjacent word pairs ("new balance 550", "Lo-Vi")
+BRAND_PHRASES = {"new balance": "New Balance", "tommy hilfiger": "Tommy Hilfiger", "lo vi": "Lo-Vi"}
+BRAND_PHRASE_WORDS = {w for phrase in BRAND_PHRASES for w in phrase.split()}
+# Weak aliases only count when no strong alias is in the title ("Air Jordan" is Jordan)
+WEAK_BRAND_ALIASES = {"air": "Nike", "max": "Nike"}
+# Extra spellings customers type in queries
+QUERY_BRAND_ALIASES = {"addidas": "Adidas", "adidaas": "Adidas", "naik": "Nike", "nikee": "Nike",
+                       "jordans": "Jordan", "sketchers": "Skechers", "hokka": "Hoka"}
+# Title abbreviations that are ordinary words (or too short) in a customer
+# query: "ye lo", "th", "ad" must not filter by brand
+TITLE_ONLY_ALIASES = {"lo", "ad", "sk", "th", "af", "hk"}
+
+COLORS = {
+    "black", "white", "grey", "gray", "red", "blue", "navy", "green", "olive", "khaki", "beige", "brown",
+    "pink", "orange", "mint", "silver", "camel", "cameel", "coffee", "mustard", "yellow", "purple",
+    "maroon", "cream", "gold", "tan", "multi",
+}
+COLOR_ALIASES = {"gray": "grey", "cameel": "camel", "kala": "black", "kaala": "black", "safed": "white",
+                 "safaid": "white", "laal": "red", "lal": "red", "neela": "blue", "hara": "green"}
+
+KEYWORDS = {
+    "gore-tex": ["goretex", "gore"], "low": ["low"], "high": ["high"], "mid": ["mid"],
+    "slides": ["slide", "slides", "slipper", "chappal"], "slip-on": ["slip"], "loafers": ["loafer", "loafers"],
+    "sandals": ["sandal", "sandals"], "running": ["running", "runn", "run", "runner"],
+    "hiking": ["hiker", "hiking", "trail"], "formal": ["formal", "dress"], "sneakers": ["sneaker", "sneakers"],
+    "boost": ["boost"], "orthopedic": ["orthopedic", "cushion"],
+}
+# "low price", "high quality": the word describes the next one, not the shoe cut
+NOT_CUT_NEXT_WORDS = {"price", "prices", "quality", "budget", "range", "rate", "end", "cost"}
+CUT_KEYWORDS = {"low", "high", "mid"}
+PAREN_RE = re.compile(r"\(([^)]*)\)")
+MODEL_STOP_RE = re.compile(r"\s[-–|(‘'\"]|$")
+
+
+def _invert(mapping):
+    return {alias: canonical for canonical, aliases in mapping.items() for alias in aliases}
+
+
+BRAND_BY_WORD = _invert(BRAND_ALIASES)
+QUERY_BRAND_BY_WORD = {
+    **{w: b for w, b in BRAND_BY_WORD.items() if w not in TITLE_ONLY_ALIASES},
+    **QUERY_BRAND_ALIASES,
+}
+KEYWORD_BY_WORD = _invert(KEYWORDS)
+
+
+def phrase_brands(words):
+    """Brands named by adjacent word pairs"""
+    return {BRAND_PHRASES[f"{a} {b}"] for a, b in zip(words, words[1:]) if f"{a} {b}" in BRAND_PHRASES}
+
+
+def query_brands(words):
+    """Brands a customer query names (brand phrases, then single-word query aliases)"""
+    brands = phrase_brands(words)
+    brands.update(QUERY_BRAND_BY_WORD[w] for w in words if w in QUERY_BRAND_BY_WORD)
+    return brands
+
+
+def title_brand(words):
+    phrases = phrase_brands(words)
+    if phrases:
+        return min(phrases)
+    for word in words:
+        if word in BRAND_BY_WORD:
+            return BRAND_BY_WORD[word]
+    for word in words:
+        if word in WEAK_BRAND_ALIASES:
+            return WEAK_BRAND_ALIASES[word]
+    return None
+
+
+def title_facets(title):
+    """Extract {facet: set(values)} from a product title"""
+    words = tokenize(title)
+    brand = title_brand(words)
+    facets = {"brand": {brand} if brand else set()}
+
+    colors = set()
+    for inner in PAREN_RE.findall(title):
+        colors.update(COLOR_ALIASES.get(w, w) for w in tokenize(inner) if COLOR_ALIASES.get(w, w) in COLORS)
+    colors.update(COLOR_ALIASES.get(w, w) for w in words if COLOR_ALIASES.get(w, w) in COLORS)
+    facets["color"] = colors
+
+    keywords = {KEYWORD_BY_WORD[w] for w in words if w in KEYWORD_BY_WORD}
+    if "gore" in words and "tex" in words:
+        keywords.add("gore-tex")
+    facets["keyword"] = keywords
+
+    # Model line: the words of the head of the title that are not brand/colour/keyword words
+    head = tokenize(title[:MODEL_STOP_RE.search(title).start()])
+    model = [w for w in head if w not in BRAND_BY_WORD and w not in COLORS and w not in KEYWORD_BY_WORD
+             and w not in WEAK_BRAND_ALIASES and w not in BRAND_PHRASE_WORDS][:2]
+    facets["model"] = {" ".join(model)} if model else set()
+    return facets
+
+
+class FacetIndex:
+    """Postings per facet value (brand, model, color, keyword) built from product titles"""
+
+    def __init__(self, products):
+        self.products = tuple(products)
+        self.postings = defaultdict(lambda: defaultdict(set))  # facet -> value -> {product_idx}
+        for idx, p in enumerate(self.products):
+            for facet, values in title_facets(p.title).items():
+                for value in values:
+                    self.postings[facet][value].add(idx)
+        self.postings = {facet: dict(values) for facet, values in self.postings.items()}
+        brand_counts = Counter({b: len(ids) for b, ids in self.postings.get("brand", {}).items()})
+        self.brands = tuple(b for b, _ in brand_counts.most_common())
+        self.brand_models = {
+            brand: Counter(m for m, m_ids in self.postings.get("model", {}).items() for _ in ids & m_ids)
+            for brand, ids in self.postings.get("brand", {}).items()
+        }
+
+    def values(self, facet):
+        return self.postings.get(facet, {})
+
+    def query_facets(self, query):
+        """Facet values mentioned in a customer query: {facet: set(values)}"""
+        words = tokenize(query)
+        found = defaultdict(set)
+        brands = {b for b in query_brands(words) if b in self.values("brand")}
+        if brands:
+            found["brand"] = brands
+        for i, word in enumerate(words):
+            color = COLOR_ALIASES.get(word, word)
+            if color in COLORS and color in self.values("color"):
+                found["color"].add(color)
+            keyword = KEYWORD_BY_WORD.get(word)
+            if keyword in CUT_KEYWORDS and words[i + 1:i + 2] and words[i + 1] in NOT_CUT_NEXT_WORDS:
+                continue
+            if keyword and keyword in self.values("keyword"):
+                found["keyword"].add(keyword)
+        return dict(found)
+
+    def match(self, query):
+        """Products matching every facet mentioned in the query (set intersection).
+
+        Values of the same facet are OR-ed ("nike or adidas"), different facets
+        are AND-ed ("black nike"). Returns None when the query names no facet.
+        """
+        found = self.query_facets(query)
+        if not found:
+            return None
+        result = None
+        for facet, values in found.items():
+            ids = set().union(*(self.postings[facet][v] for v in values))
+            result = ids if result is None else result & ids
+        return [self.products[i] for i in sorted(result)]
+
+    def summary(self, query, max_models=8):
+        """Short facet text for the prompt: only the brands (and their models) the query is about"""
+        brands = self.query_facets(query).get("brand")
+        if not brands:
+            return ", ".join(self.brands)
+        lines = []
+        for brand in sorted(brands):
+            top = ", ".join(m for m, _ in self.brand_models.get(brand, Counter()).most_common(max_models))
+            lines.append(f"{brand}: {top}" if top else brand)
+        return "\n".join(lines)
@@ -0,0 +1,260 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from bot.cache import normalize_query
+
+# Keyword / Roman Urdu lexicon per intent. Phrases are matched on the
+# normalized query (see cache.normalize_query), so spelling variants collapse.
+# Single words that mean something else as often as not ("off" in "off white",
+# "number" in a size) are left out.
+LEXICON = {
+    "delivery": ["delivery", "deliver", "shipping", "ship", "courier", "cod", "cash on delivery",
+                 "kab tak", "kitne din", "kitna din", "parcel", "delivery charge"],
+    "contact": ["contact", "contact number", "phone", "whatsapp", "email", "address", "rabta",
+                "customer service", "helpline", "location", "shop kahan"],
+    "sale": ["sale", "discount", "offer", "deal", "deals", "flash", "promo", "kam price"],
+    "price": ["price", "rate", "kitne ka", "kitne ki", "kitne mein", "cost", "how much"],
+    "show_products": ["dikhao", "show", "chahiye", "options", "recommend",
+                      "suggest", "dikha do", "milega", "milay ga", "collection"],
+}
+# Phrases that hint at an intent but do not decide it on their own: one weak
+# hit stays below the confidence threshold unless another phrase or the
+# trained model agrees
+WEAK_PHRASES = {
+    "ship", "kab tak", "kitne din", "kitna din", "parcel", "address", "location", "shop kahan",
+    "offer", "deal", "deals", "flash", "promo", "kam price", "rate", "cost", "options",
+    "recommend", "suggest", "milega", "milay ga", "collection",
+}
+LEXICON = {intent: list(dict.fromkeys(normalize_query(p) for p in phrases)) for intent, phrases in LEXICON.items()}
+WEAK_PHRASES = {normalize_query(p) for p in WEAK_PHRASES}
+WEAK_WEIGHT = 0.5
+INTENTS = tuple(LEXICON)
+# Weight of the implicit "something else" class: one strong hit gives
+# 1 / (1 + OTHER_WEIGHT) = 0.67 confidence (still one signal, see
+# MIN_SIGNALS), one weak hit only 0.5, two conflicting hits at most 0.4.
+OTHER_WEIGHT = 0.5
+# Complaints, order follow-ups and negations ("abhi tak nahi aayi", "order
+# 12345", "refund") need the LLM even when an intent word is in them: a
+# templated delivery or price reply would not answer them.
+NEGATIVE_CUES = {
+    "nahi", "nahin", "nhi", "not", "abhi tak", "ab tak", "cancel", "refund", "return", "exchange",
+    "status", "complaint", "complain", "shikayat", "track", "tracking", "wrong", "ghalat", "damaged",
+}
+ORDER_NUMBER_RE = re.compile(r"\b(?:order|parcel|tracking)\s+(?:no\s+|number\s+|id\s+)?\d{3,}\b")
+# A local answer needs two signals for its intent: two lexicon phrases, or
+# one phrase the trained model agrees with
+MIN_SIGNALS = 2
+ROMAN_URDU_WORDS = {
+    "mujhe", "kaun", "kon", "kaha", "kahan", "dikhao", "dikho", "sasta", "mahanga", "kya", "hai", "kitna",
+    "chahiye", "aap", "bhai", "kab", "tak", "ka", "ki", "ke", "mein", "hain", "karo", "kar", "wala", "do",
+}
+
+
+def is_roman_urdu(text):
+    return bool(set(normalize_query(text).split()) & ROMAN_URDU_WORDS)
+
+
+def lexicon_scores(query):
+    """Weighted lexicon phrase hits per intent in a normalized query (weak phrases count WEAK_WEIGHT)"""
+    padded = f" {normalize_query(query)} "
+    return {intent: sum(WEAK_WEIGHT if phrase in WEAK_PHRASES else 1 for phrase in phrases if f" {phrase} " in padded)
+            for intent, phrases in LEXICON.items()}
+
+
+def has_negative_cue(query):
+    """True for complaints, order follow-ups and negations, which always go to the LLM"""
+    normalized = normalize_query(query)
+    padded = f" {normalized} "
+    return any(f" {cue} " in padded for cue in NEGATIVE_CUES) or bool(ORDER_NUMBER_RE.search(normalized))
+
+
+class NaiveBayesIntentModel:
+    """Multinomial Naive Bayes over normalized query words, trained offline by `train_intents`"""
+
+    def __init__(self, priors, word_logprobs, unknown_logprobs):
+        self.priors = priors
+        self.word_logprobs = word_logprobs
+        self.unknown_logprobs = unknown_logprobs
+
+    @classmethod
+    def train(cls, examples, alpha=1.0):
+        """examples: iterable of (query, intent) -> model"""
+        class_counts = Counter()
+        word_counts = defaultdict(Counter)
+        vocab = set()
+        for query, intent in examples:
+            words = normalize_query(query).split()
+            class_counts[intent] += 1
+            word_counts[intent].update(words)
+            vocab.update(words)
+        total = sum(class_counts.values())
+        priors = {c: math.log(n / total) for c, n in class_counts.items()}
+        word_logprobs, unknown = {}, {}
+        for c in class_counts:
+            denom = sum(word_counts[c].values()) + alpha * (len(vocab) + 1)
+            word_logprobs[c] = {w: math.log((n + alpha) / denom) for w, n in word_counts[c].items()}
+            unknown[c] = math.log(alpha / denom)
+        return cls(priors, word_logprobs, unknown)
+
+    def predict_proba(self, query):
+        words = normalize_query(query).split()
+        logp = {
+            c: prior + sum(self.word_logprobs[c].get(w, self.unknown_logprobs[c]) for w in words)
+            for c, prior in self.priors.items()
+        }
+        top = max(logp.values())
+        exp = {c: math.exp(v - top) for c, v in logp.items()}
+        total = sum(exp.values())
+        return {c: v / total for c, v in exp.items()}
+
+    def to_dict(self):
+        return {"priors": self.priors, "word_logprobs": self.word_logprobs, "unknown_logprobs": self.unknown_logprobs}
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["priors"], data["word_logprobs"], data["unknown_logprobs"])
+
+
+# Products listed in a local reply; a session's "aur options" continues after these
+PRODUCTS_SHOWN = 3
+
+
+def format_products(products, limit=PRODUCTS_SHOWN):
+    return "\n".join(f"👟 {p.title} – Rs. {p.price}" for p in list(products)[:limit])
+
+
+class LocalAnswerEngine:
+    """Answers common intents (delivery, contact, sale, price, show products) without Gemini.
+
+    Intent confidence comes from the lexicon, averaged with the offline Naive
+    Bayes model when one has been trained. Below `min_confidence`, with fewer
+    than MIN_SIGNALS signals, or with a negative cue the engine returns None
+    and the caller goes to the LLM.
+    """
+
+    def __init__(self, model=None, min_confidence=0.6):
+        self.model = model
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self.total = 0
+        self.answered = Counter()
+
+    def classify(self, query):
+        """Return (intent, confidence); intent is None if nothing matched"""
+        intent, confidence, _ = self._classify(query)
+        return intent, confidence
+
+    def _classify(self, query):
+        """(intent, confidence, signals): lexicon phrase hits for the intent, plus one if the model agrees"""
+        hits = lexicon_scores(query)
+        total = sum(hits.values()) + OTHER_WEIGHT
+        probs = {intent: n / total for intent, n in hits.items()}
+        model_intent = None
+        if self.model is not None:
+            model_probs = self.model.predict_proba(query)
+            probs = {intent: (p + model_probs.get(intent, 0.0)) / 2 for intent, p in probs.items()}
+            model_intent = max(model_probs, key=model_probs.get)
+        intent = max(probs, key=probs.get)
+        if probs[intent] <= 0:
+            return None, 0.0, 0
+        padded = f" {normalize_query(query)} "
+        signals = sum(f" {phrase} " in padded for phrase in LEXICON[intent]) + (model_intent == intent)
+        return intent, probs[intent], signals
+
+    def answer(self, query, catalog, find_products):
+        """Templated WhatsApp-style reply, or None to fall through to the LLM"""
+        intent, confidence, signals = self._classify(query)
+        reply = None
+        if (intent is not None and confidence >= self.min_confidence and signals >= MIN_SIGNALS
+                and not has_negative_cue(query)):
+            urdu = is_roman_urdu(query)
+            reply = getattr(self, f"answer_{intent}")(query, catalog, find_products, urdu)
+        with self._lock:
+            self.total += 1
+            if reply:
+                self.answered[intent] += 1
+        return reply
+
+    def answer_delivery(self, query, catalog, find_products, urdu):
+        lines = catalog.facts["delivery"]
+        if not lines:
+            return None
+        ending = "Aap order karna chahenge? 👉 https://royaltrend.pk" if urdu else \
+            "Would you like to place an order? 👉 https://royaltrend.pk"
+        return f"🚚 {lines[0]}\n{ending}"
+
+    def answer_contact(self, query, catalog, find_products, urdu):
+        facts = catalog.facts
+        if not facts["phone"] and not facts["email"]:
+            return None
+        lines = []
+        if facts["phone"]:
+            lines.append(f"📞 Customer Service / WhatsApp: {facts['phone']}")
+        if facts["email"]:
+            lines.append(f"📧 {facts['email']}")
+        lines.append("Aur koi madad chahiye?" if urdu else "Anything else I can help with?")
+        return "\n".join(lines)
+
+    def answer_sale(self, query, catalog, find_products, urdu):
+        facts = catalog.facts
+        if not facts["sale"] and not facts["sale_products"]:
+            return None
+        lines = [f"🔥 {facts['sale'][0]}"] if facts["sale"] else []
+        lines += [f"👟 {line}" for line in facts["sale_products"][:3]]
+        lines.append("Aur options chahiye?" if urdu else "Want to see more options?")
+        return "\n".join(lines)
+
+    def answer_price(self, query, catalog, find_products, urdu):
+        products = find_products(query)
+        if not products:
+            return None
+        ending = "Aapko size bataun?" if urdu else "Shall I tell you the sizes?"
+        return f"{format_products(products)}\n{ending}"
+
+    def answer_show_products(self, query, catalog, find_products, urdu):
+        products = find_products(query)
+        if not products:
+            return None
+        header = "Yeh options available hain:" if urdu else "Here are some options:"
+        ending = "Aur options chahiye?" if urdu else "Want to see more options?"
+        return f"{header}\n{format_products(products)}\n{ending}"
+
+    def stats(self):
+        with self._lock:
+            answered = sum(self.answered.values())
+            return {
+                "total": self.total,
+                "answered_locally": answered,
+                "by_intent": dict(self.answered),
+                "bypass_rate": round(answered / self.total, 4) if self.total else 0.0,
+            }
+
+
+INTENT_ENGINE = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_intent_engine():
+    """Local answer engine, with the offline-trained model if its file exists"""
+    global INTENT_ENGINE
+    if INTENT_ENGINE is None:
+        with _ENGINE_LOCK:
+            if INTENT_ENGINE is None:
+                path = getattr(settings, "INTENT_MODEL_FILE", settings.BASE_DIR / "intent_model.json")
+                model = NaiveBayesIntentModel.load(path) if os.path.exists(path) else None
+                INTENT_ENGINE = LocalAnswerEngine(
+                    model, min_confidence=getattr(settings, "LOCAL_INTENT_MIN_CONFIDENCE", 0.6)
+                )
+    return INTENT_ENGINE
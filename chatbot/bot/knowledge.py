@@ -0,0 +1,290 @@
+import json
+import math
+import mmap
+import os
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from bot.cache import normalize_query
+
+PHONE_RE = re.compile(r"\+?\d[\d\s-]{8,}\d")
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+PAGE_HEADER_RE = re.compile(r"^==== (\S+) ====$", re.MULTILINE)
+PRICE_RE = re.compile(r"^Rs\. [\d,]+(\.\d+)?$")
+LETTER_RE = re.compile(r"[A-Za-z]")
+# Countdown widget text ("Sale up to 60% off ... End ins:", "02:14:09",
+# "3 days 4 hours"): its numbers are filled in by JavaScript, so the
+# scraped line is a fragment and never a sale headline
+COUNTDOWN_RE = re.compile(
+    r"(?::\s*$|\bends?\s+ins?\b|\b\d{1,2}:\d{2}(?::\d{2})?\b|\bdays?\b.*\bhours?\b|\bhrs?\b.*\bmins?\b)",
+    re.IGNORECASE,
+)
+
+# Shopify theme chrome that carries no knowledge for the bot
+NOISE_LINES = {
+    "unit price", "per", "quick view", "add to wishlist", "vendor", "vendor:", "royal trend",
+    "close", "search", "log in", "login", "cart", "items", "0 items", "menu", "sign in",
+    "create account", "create an account", "my wish list", "clear all", "choose options",
+    "example product title", "skip to content", "results", "min", "max", "to", "sort",
+    "sort by", "filter", "email address", "password", "forgot your password?", "subscribe",
+    "shopping cart", "shop now", "view all", "refined by",
+}
+# A line found on this many pages (or more) is site-wide boilerplate
+BOILERPLATE_MIN_PAGES = 3
+SITE = "site"
+# Passages are groups of whole lines of at most this many characters
+PASSAGE_CHARS = 300
+
+
+def knowledge_paths():
+    return (
+        getattr(settings, "KNOWLEDGE_FILE", settings.BASE_DIR / "knowledge.txt"),
+        getattr(settings, "KNOWLEDGE_INDEX_FILE", settings.BASE_DIR / "knowledge_index.json"),
+    )
+
+
+def split_pages(text):
+    """pages_content.txt text -> {url: page text}"""
+    pages = {}
+    headers = list(PAGE_HEADER_RE.finditer(text))
+    for i, match in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        pages[match.group(1)] = text[match.end():end].strip()
+    return pages
+
+
+def is_noise(line):
+    return not LETTER_RE.search(line) or line.lower() in NOISE_LINES
+
+
+def parse_page(text):
+    """Split raw get_text() output into de-duplicated content lines and product lines"""
+    content, products = [], []
+    prices = []
+
+    def flush():
+        # The last content line before a price block is the product title
+        if prices and content:
+            title = content.pop()
+            sale, regular = prices[0], max(prices, key=lambda p: float(p[4:].replace(",", "")))
+            line = f"{title} – {sale}" if sale == regular else f"{title} – {sale} (was {regular})"
+            products.append(line)
+        prices.clear()
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if PRICE_RE.match(line):
+            prices.append(line)
+            continue
+        flush()
+        if is_noise(line) or line.endswith("...") or line.startswith("Product Description:"):
+            continue  # chrome, or a truncated product teaser
+        content.append(line)
+    flush()
+    return list(dict.fromkeys(content)), list(dict.fromkeys(products))
+
+
+def is_site_fact(line):
+    """Site-wide lines worth keeping: banner, phone, email, delivery"""
+    lower = line.lower()
+    return len(line) < 160 and bool(
+        PHONE_RE.search(line) or EMAIL_RE.search(line) or "delivery" in lower
+        or (("sale" in lower or "% off" in lower) and "%" in line)
+    )
+
+
+def compact_pages(pages):
+    """Deduplicate pages and strip cross-page boilerplate (menus, footer, theme widgets).
+
+    Of the lines repeated across pages only the site facts (banner, phone,
+    email, delivery) are kept, once, in a small site section. Returns
+    [(page, section, text)] in a stable order: site facts first, then each
+    page's own content and products.
+    """
+    parsed = {url: parse_page(text) for url, text in pages.items()}
+    min_pages = min(BOILERPLATE_MIN_PAGES, max(2, len(parsed)))
+    content_counts = Counter(line for content, _ in parsed.values() for line in content)
+    product_counts = Counter(line for _, products in parsed.values() for line in products)
+    common = {line for line, n in content_counts.items() if n >= min_pages}
+    common_products = {line for line, n in product_counts.items() if n >= min_pages}
+    facts = [line for line in content_counts if line in common and is_site_fact(line)]
+
+    sections = []
+    if facts:
+        sections.append((SITE, "facts", "\n".join(facts)))
+    for url, (content, products) in parsed.items():
+        own = [line for line in content if line not in common]
+        own_products = [line for line in products if line not in common_products]
+        if own:
+            sections.append((url, "content", "\n".join(own)))
+        if own_products:
+            sections.append((url, "products", "\n".join(own_products)))
+    return sections
+
+
+def write_knowledge(sections, blob_path=None, index_path=None):
+    """Write section texts to one UTF-8 blob plus a JSON index of byte offsets"""
+    default_blob, default_index = knowledge_paths()
+    blob_path, index_path = blob_path or default_blob, index_path or default_index
+    entries = []
+    offset = 0
+    with open(f"{blob_path}.tmp", "wb") as f:
+        for page, section, text in sections:
+            data = text.encode("utf-8") + b"\n"
+            f.write(data)
+            entries.append({"page": page, "section": section, "offset": offset, "length": len(data) - 1})
+            offset += len(data)
+    with open(f"{index_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"size": offset, "sections": entries}, f, ensure_ascii=False, indent=1)
+    os.replace(f"{blob_path}.tmp", blob_path)
+    os.replace(f"{index_path}.tmp", index_path)
+    return entries
+
+
+class KnowledgeBase:
+    """Read-only view of the compacted knowledge files; section text is read from a memory map on demand"""
+
+    def __init__(self, blob_path, index_path):
+        self.blob_path = blob_path
+        with open(index_path, "r", encoding="utf-8") as f:
+            self.sections = json.load(f)["sections"]
+        self._mm = None
+
+    @classmethod
+    def load(cls):
+        """KnowledgeBase from the configured files, or None if the scraper has not written them"""
+        blob_path, index_path = knowledge_paths()
+        if not (os.path.exists(blob_path) and os.path.exists(index_path)):
+            return None
+        return cls(blob_path, index_path)
+
+    def _read(self, entry):
+        if entry["length"] == 0:
+            return ""
+        if self._mm is None:
+            with open(self.blob_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm[entry["offset"]:entry["offset"] + entry["length"]].decode("utf-8")
+
+    def section(self, page, name):
+        for entry in self.sections:
+            if entry["page"] == page and entry["section"] == name:
+                return self._read(entry)
+        return ""
+
+    def iter_sections(self):
+        """Yield (page, section, text) in file order"""
+        for entry in self.sections:
+            yield entry["page"], entry["section"], self._read(entry)
+
+    def text(self, limit=None):
+        """Sections joined in file order, cut at `limit` characters"""
+        parts, size = [], 0
+        for _, _, text in self.iter_sections():
+            parts.append(text)
+            size += len(text) + 1
+            if limit is not None and size >= limit:
+                break
+        joined = "\n".join(parts)
+        return joined[:limit] if limit is not None else joined
+
+
+def make_passages(sections, max_chars=PASSAGE_CHARS):
+    """Cut (page, section, text) sections into passages of whole lines"""
+    passages = []
+    for page, section, text in sections:
+        lines, size = [], 0
+        for line in text.splitlines():
+            if lines and size + len(line) > max_chars:
+                passages.append((page, section, "\n".join(lines)))
+                lines, size = [], 0
+            lines.append(line)
+            size += len(line) + 1
+        if lines:
+            passages.append((page, section, "\n".join(lines)))
+    return passages
+
+
+class PassageIndex:
+    """BM25 index over knowledge passages, used to pick prompt context per query"""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, sections):
+        self.passages = make_passages(sections)
+        self.postings = defaultdict(list)  # word -> [(passage_idx, tf)]
+        self.lengths = []
+        for idx, (_, _, text) in enumerate(self.passages):
+            words = normalize_query(text).split()
+            self.lengths.append(len(words))
+            for word, tf in Counter(words).items():
+                self.postings[word].append((idx, tf))
+        n = len(self.passages)
+        self.avg_length = (sum(self.lengths) / n) if n else 0
+        self.idf = {
+            word: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for word, plist in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.passages)
+
+    def search(self, query, k=5):
+        """Return [(score, passage_idx)] for the best `k` passages"""
+        scores = defaultdict(float)
+        for word in set(normalize_query(query).split()):
+            idf = self.idf.get(word)
+            if idf is None:
+                continue
+            for idx, tf in self.postings[word]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[idx] / self.avg_length)
+                scores[idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(((score, idx) for idx, score in scores.items()), reverse=True)[:k]
+
+    def context(self, query, budget=1200, k=5):
+        """Top passages for a query that fit in `budget` characters, in file order.
+
+        Falls back to the first passage (site facts: banner, contact, delivery) when
+        nothing in the knowledge base matches the query.
+        """
+        hits = [idx for _, idx in self.search(query, k)] or ([0] if self.passages else [])
+        chosen, used = [], 0
+        for idx in hits:
+            text = self.passages[idx][2]
+            if used + len(text) > budget:
+                continue
+            chosen.append(idx)
+            used += len(text) + 1
+        return "\n".join(self.passages[idx][2] for idx in sorted(chosen))
+
+
+def extract_site_facts(sections):
+    """Pull the facts local answers need (phone, email, delivery/sale lines, sale products)"""
+    facts = {"phone": None, "email": None, "delivery": [], "sale": [], "sale_products": []}
+    for page, section, text in sections:
+        if section == "products":
+            if "sale" in page:
+                facts["sale_products"].extend(text.splitlines())
+            continue
+        for line in text.splitlines():
+            lower = line.lower()
+            if facts["phone"] is None and ("customer service" in lower or "call" in lower or "whatsapp" in lower):
+                match = PHONE_RE.search(line)
+                if match:
+                    facts["phone"] = match.group(0).strip()
+            if facts["email"] is None:
+                match = EMAIL_RE.search(line)
+                if match:
+                    facts["email"] = match.group(0)
+            if "delivery" in lower and len(line) < 120 and line not in facts["delivery"]:
+                facts["delivery"].append(line)
+            if ("sale" in lower or "% off" in lower) and "%" in line and line not in facts["sale"] \
+                    and not COUNTDOWN_RE.search(line):
+                facts["sale"].append(line)
+    facts["sale"].sort(key=len)  # short banner lines first
+    return facts
@@ -0,0 +1,620 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+import weakref
+from collections import deque
+
+import httpx
+from django.conf import settings
+
+
+class LLMPool:
+    """Process-wide bounded thread pool for upstream LLM calls.
+
+    Unlike a per-request `with ThreadPoolExecutor()` block, callers never wait
+    for the worker to finish: once the deadline passes the future is cancelled
+    (if it has not started yet) or detached and left to finish on its own.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="llm"
+        )
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.detached = 0
+
+    def _wrap(self, fn, args, kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            self.queued += 1
+        # Run in the caller's context so timed() stages land in its request breakdown
+        future = self._executor.submit(contextvars.copy_context().run, self._wrap, fn, args, kwargs)
+        # A cancelled future never reaches _wrap, so undo its queue slot here
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def run(self, fn, *args, timeout, **kwargs):
+        """Run fn on the pool and return its result, raising TimeoutError after `timeout` seconds"""
+        return self.wait(self.submit(fn, *args, **kwargs), timeout)
+
+    def wait(self, future, timeout, abandon=True):
+        """Wait up to `timeout` for a pool future; on timeout optionally abandon it"""
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            if abandon:
+                self.abandon(future)
+            raise
+
+    def abandon(self, future):
+        """Cancel a future that has not started yet, otherwise detach it"""
+        cancelled = future.cancel()
+        with self._lock:
+            if cancelled:
+                self.cancelled += 1
+            elif not future.done():
+                self.detached += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled,
+                "detached": self.detached,
+            }
+
+
+LLM_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_llm_pool():
+    """Create the shared LLM worker pool only once per process"""
+    global LLM_POOL
+    if LLM_POOL is None:
+        with _POOL_LOCK:
+            if LLM_POOL is None:
+                LLM_POOL = LLMPool(getattr(settings, "LLM_MAX_WORKERS", 8))
+    return LLM_POOL
+
+
+class SingleFlight:
+    """Coalesce concurrent identical LLM calls onto one in-flight pool future.
+
+    Every caller waits with its own deadline; the shared future is only
+    abandoned when the last waiter has given up on it.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._calls = {}  # key -> [future, waiters]
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.collapsed = 0
+
+    def run(self, key, fn, timeout):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [self.pool.submit(fn), 0]
+                self.leaders += 1
+            else:
+                self.collapsed += 1
+            call[1] += 1
+        future = call[0]
+        if leader:
+            # Outside the lock: the callback runs inline if fn already finished
+            future.add_done_callback(lambda f: self._forget(key, f))
+        try:
+            return self.pool.wait(future, timeout, abandon=False)
+        except concurrent.futures.TimeoutError:
+            with self._lock:
+                call[1] -= 1
+                last = call[1] == 0
+                if last and self._calls.get(key) is call:
+                    del self._calls[key]
+            if last:
+                self.pool.abandon(future)
+            raise
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def _forget(self, key, future):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call[0] is future:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "collapsed": self.collapsed}
+
+
+class AsyncSingleFlight:
+    """SingleFlight for one event loop: concurrent identical calls await one shared Task.
+
+    The task leaves the group when it finishes. Callers wait on it through
+    shield(), so a call every waiter gave up on still finishes (and fills the
+    answer cache) instead of being cancelled.
+    """
+
+    def __init__(self):
+        self._tasks = {}  # key -> asyncio.Task
+        self.leaders = 0
+        self.collapsed = 0
+
+    def task(self, key, make_coro):
+        """The in-flight task for `key`, started from make_coro() if there is none"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(make_coro())
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.leaders += 1
+        else:
+            self.collapsed += 1
+        return task
+
+    def in_flight(self, key):
+        return key in self._tasks
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # A call nobody waits for any more must not log "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {"in_flight": len(self._tasks), "leaders": self.leaders, "collapsed": self.collapsed}
+
+
+SINGLE_FLIGHT = None
+# Tasks belong to one event loop, so each loop gets its own group
+ASYNC_SINGLE_FLIGHTS = weakref.WeakKeyDictionary()
+
+
+def get_single_flight():
+    """Single-flight group sitting on the shared LLM pool"""
+    global SINGLE_FLIGHT
+    if SINGLE_FLIGHT is None:
+        pool = get_llm_pool()
+        with _POOL_LOCK:
+            if SINGLE_FLIGHT is None:
+                SINGLE_FLIGHT = SingleFlight(pool)
+    return SINGLE_FLIGHT
+
+
+def get_async_single_flight():
+    """Single-flight group for Gemini calls awaited on the running event loop"""
+    loop = asyncio.get_running_loop()
+    flight = ASYNC_SINGLE_FLIGHTS.get(loop)
+    if flight is None:
+        flight = ASYNC_SINGLE_FLIGHTS[loop] = AsyncSingleFlight()
+    return flight
+
+
+class AdmissionRejected(Exception):
+    """No LLM slot could be had within the request's deadline"""
+
+
+class AdmissionGate:
+    """Bounded concurrency for upstream LLM calls with a small deadline-ordered wait queue.
+
+    At most `max_concurrency` calls run at once and at most `max_queue` wait;
+    waiters are admitted earliest-deadline first. A call that finds the queue
+    full, or whose estimated wait (queue position x recent call time) does not
+    fit before its deadline, is rejected right away.
+    """
+
+    def __init__(self, max_concurrency=4, max_queue=4, wait_window=500):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters = []  # heap of (deadline, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_deadline = 0
+        self.rejected_estimate = 0
+        self.waits = deque(maxlen=wait_window)  # queue wait (seconds) of admitted calls
+        self.service_times = deque(maxlen=wait_window)  # duration (seconds) of admitted calls
+
+    def check(self, deadline):
+        """Raise AdmissionRejected now if a call with this deadline could not get a slot in time"""
+        with self._cond:
+            self._check(deadline)
+
+    def acquire(self, deadline):
+        """Take a slot before the monotonic `deadline`; returns the queue wait in seconds"""
+        start = time.monotonic()
+        with self._cond:
+            entry = self._enter(deadline)
+            if entry is None:
+                return self._admit(start)
+            try:
+                while not self._ready(entry):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_deadline += 1
+                        raise AdmissionRejected("no LLM slot before the deadline")
+                    self._cond.wait(remaining)
+                return self._admit(start)
+            finally:
+                self._leave(entry)
+
+    def estimated_wait(self):
+        # Caller holds the lock. Queue position x median recent call time, spread over the slots
+        if self.active < self.max_concurrency and not self._waiters:
+            return 0.0
+        if not self.service_times or self.max_concurrency <= 0:
+            return 0.0
+        service = sorted(self.service_times)[len(self.service_times) // 2]
+        return (len(self._waiters) + 1) * service / self.max_concurrency
+
+    def _check(self, deadline):
+        # Caller holds the lock. True = a slot is free right now
+        if self.active < self.max_concurrency and not self._waiters:
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_full += 1
+            raise AdmissionRejected("LLM queue full")
+        if self.estimated_wait() > deadline - time.monotonic():
+            self.rejected_estimate += 1
+            raise AdmissionRejected("estimated LLM queue wait exceeds the deadline")
+        return False
+
+    def _enter(self, deadline):
+        # Caller holds the lock. None = admit now, otherwise the caller's queue entry
+        if self._check(deadline):
+            return None
+        entry = (deadline, next(self._seq))
+        heapq.heappush(self._waiters, entry)
+        return entry
+
+    def _ready(self, entry):
+        return self.active < self.max_concurrency and self._waiters[0] == entry
+
+    def _leave(self, entry):
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+        # The next waiter may be admissible now that this one left the queue
+        self._cond.notify_all()
+
+    def _admit(self, start):
+        waited = time.monotonic() - start
+        self.active += 1
+        self.admitted += 1
+        self.waits.append(waited)
+        return waited
+
+    def release(self, service_time=None):
+        """Free a slot; `service_time` (seconds the call took) feeds the wait estimate"""
+        with self._cond:
+            self.active -= 1
+            if service_time is not None:
+                self.service_times.append(service_time)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self.waits)
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self.active,
+                "waiting": len(self._waiters),
+                "admitted": self.admitted,
+                "rejected_full": self.rejected_full,
+                "rejected_deadline": self.rejected_deadline,
+                "rejected_estimate": self.rejected_estimate,
+                "wait_p50": waits[len(waits) // 2] if waits else None,
+                "wait_p95": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else None,
+            }
+
+
+class AsyncAdmissionGate(AdmissionGate):
+    """AdmissionGate for coroutines on one event loop: waiters await a future that release() resolves"""
+
+    def __init__(self, max_concurrency=100, max_queue=2000, wait_window=500):
+        super().__init__(max_concurrency, max_queue, wait_window)
+        self._wakeups = {}  # queue entry -> future of the coroutine waiting on it
+
+    async def acquire_async(self, deadline):
+        """Take a slot before the monotonic `deadline`; returns the queue wait in seconds"""
+        start = time.monotonic()
+        with self._cond:
+            entry = self._enter(deadline)
+            if entry is None:
+                return self._admit(start)
+        try:
+            while True:
+                with self._cond:
+                    if self._ready(entry):
+                        return self._admit(start)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_deadline += 1
+                        raise AdmissionRejected("no LLM slot before the deadline")
+                    wakeup = self._wakeups[entry] = asyncio.get_running_loop().create_future()
+                try:
+                    await asyncio.wait_for(wakeup, remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self._wakeups.pop(entry, None)
+                self._leave(entry)
+                self._wake()
+
+    def _wake(self):
+        # Caller holds the lock. A slot is free: wake the waiter at the head of the queue
+        if self._waiters and self.active < self.max_concurrency:
+            wakeup = self._wakeups.get(self._waiters[0])
+            if wakeup is not None and not wakeup.done():
+                wakeup.set_result(None)
+
+    def release(self, service_time=None):
+        super().release(service_time)
+        with self._cond:
+            self._wake()
+
+
+ADMISSION_GATE = None
+# One gate per event loop; sized for sockets (GEMINI_ASYNC_POOL_SIZE), not threads
+ASYNC_ADMISSION_GATES = weakref.WeakKeyDictionary()
+
+
+def get_admission_gate():
+    """Concurrency gate shared by all Gemini calls in this process"""
+    global ADMISSION_GATE
+    if ADMISSION_GATE is None:
+        with _POOL_LOCK:
+            if ADMISSION_GATE is None:
+                ADMISSION_GATE = AdmissionGate(
+                    max_concurrency=getattr(settings, "LLM_MAX_CONCURRENCY", 4),
+                    max_queue=getattr(settings, "LLM_MAX_QUEUE", 4),
+                )
+    return ADMISSION_GATE
+
+
+def get_async_admission_gate():
+    """Concurrency gate for Gemini calls awaited on the running event loop"""
+    loop = asyncio.get_running_loop()
+    gate = ASYNC_ADMISSION_GATES.get(loop)
+    if gate is None:
+        gate = ASYNC_ADMISSION_GATES[loop] = AsyncAdmissionGate(
+            max_concurrency=getattr(settings, "GEMINI_ASYNC_POOL_SIZE", 100),
+            max_queue=getattr(settings, "LLM_ASYNC_MAX_QUEUE", 2000),
+        )
+    return gate
+
+
+class CircuitBreaker:
+    """Rolling error/latency window around the Gemini upstream.
+
+    closed -> open when the error rate over the last `window` calls reaches
+    `error_threshold` (after `min_calls`); open -> half_open after `cooldown`
+    seconds, where a single probe call decides between closed and open again.
+    The per-call timeout adapts to the observed p95 latency.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window=50, min_calls=10, error_threshold=0.5, cooldown=30,
+                 min_timeout=1.0, timeout_factor=1.5):
+        self.calls = deque(maxlen=window)  # (ok, latency)
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.min_timeout = min_timeout
+        self.timeout_factor = timeout_factor
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probe_started = None  # monotonic start of the half-open probe
+        self.times_opened = 0
+        self.short_circuited = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go upstream now"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self.probe_started = None
+            if self.state == self.CLOSED:
+                return True
+            # A probe that never reported back (e.g. rejected at admission) is replaced after a cooldown
+            if self.state == self.HALF_OPEN and (
+                self.probe_started is None or now - self.probe_started >= self.cooldown
+            ):
+                self.probe_started = now
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record(self, ok, latency):
+        with self._lock:
+            self.calls.append((ok, latency))
+            if self.state == self.HALF_OPEN:
+                if ok:
+                    self.state = self.CLOSED
+                    self.calls.clear()
+                else:
+                    self._open()
+                self.probe_started = None
+                return
+            if self.state == self.CLOSED and len(self.calls) >= self.min_calls:
+                errors = sum(1 for call_ok, _ in self.calls if not call_ok)
+                if errors / len(self.calls) >= self.error_threshold:
+                    self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def latency_percentile(self, q):
+        with self._lock:
+            latencies = sorted(latency for ok, latency in self.calls if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def timeout(self, default):
+        """Per-call timeout: p95 of recent successful calls x factor, within [min_timeout, default]"""
+        p95 = self.latency_percentile(0.95)
+        if p95 is None:
+            return default
+        return max(self.min_timeout, min(default, p95 * self.timeout_factor))
+
+    def stats(self):
+        p50, p95 = self.latency_percentile(0.5), self.latency_percentile(0.95)
+        with self._lock:
+            errors = sum(1 for ok, _ in self.calls if not ok)
+            return {
+                "state": self.state,
+                "window_calls": len(self.calls),
+                "error_rate": round(errors / len(self.calls), 4) if self.calls else 0.0,
+                "latency_p50": p50,
+                "latency_p95": p95,
+                "times_opened": self.times_opened,
+                "short_circuited": self.short_circuited,
+            }
+
+
+BREAKER = None
+
+
+def get_breaker():
+    """Circuit breaker shared by all Gemini calls in this process"""
+    global BREAKER
+    if BREAKER is None:
+        with _POOL_LOCK:
+            if BREAKER is None:
+                BREAKER = CircuitBreaker(
+                    cooldown=getattr(settings, "GEMINI_BREAKER_COOLDOWN", 30),
+                    error_threshold=getattr(settings, "GEMINI_BREAKER_ERROR_RATE", 0.5),
+                    min_timeout=getattr(settings, "GEMINI_MIN_TIMEOUT", 1.0),
+                )
+    return BREAKER
+
+
+def http_client_options(pool_size):
+    return {
+        "base_url": getattr(settings, "GEMINI_API_BASE", "https://generativelanguage.googleapis.com"),
+        "headers": {"Content-Type": "application/json"},
+        "limits": httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=getattr(settings, "GEMINI_KEEPALIVE_EXPIRY", 60),
+        ),
+    }
+
+
+HTTP_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_http_client():
+    """Long-lived keep-alive HTTP client shared by all LLM worker threads"""
+    global HTTP_CLIENT
+    if HTTP_CLIENT is None:
+        with _CLIENT_LOCK:
+            if HTTP_CLIENT is None:
+                HTTP_CLIENT = httpx.Client(**http_client_options(getattr(settings, "GEMINI_HTTP_POOL_SIZE", 10)))
+    return HTTP_CLIENT
+
+
+def close_http_client():
+    """Close the shared client (e.g. after GEMINI_API_BASE changes)"""
+    global HTTP_CLIENT
+    with _CLIENT_LOCK:
+        if HTTP_CLIENT is not None:
+            HTTP_CLIENT.close()
+        HTTP_CLIENT = None
+
+
+# One AsyncClient per event loop: an AsyncClient cannot be shared across loops
+ASYNC_HTTP_CLIENTS = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client():
+    """Keep-alive AsyncClient for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = ASYNC_HTTP_CLIENTS.get(loop)
+    if client is None:
+        # Async calls wait on sockets, not threads, so allow many more connections
+        options = http_client_options(getattr(settings, "GEMINI_ASYNC_POOL_SIZE", 100))
+        client = ASYNC_HTTP_CLIENTS[loop] = httpx.AsyncClient(**options)
+    return client
+
+
+async def close_async_http_client():
+    """Close the running loop's AsyncClient"""
+    client = ASYNC_HTTP_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def gemini_timeout(deadline):
+    """Split a per-request deadline into connect and read timeouts"""
+    connect = min(getattr(settings, "GEMINI_CONNECT_TIMEOUT", 1.0), deadline)
+    return httpx.Timeout(deadline, connect=connect, pool=connect)
+
+
+def gemini_generate(prompt, api_key, deadline=30):
+    """POST a prompt to Gemini generateContent over the shared client"""
+    model = getattr(settings, "GEMINI_MODEL", "gemini-2.5-flash-lite")
+    return get_http_client().post(
+        f"/v1beta/models/{model}:generateContent",
+        params={"key": api_key},
+        json={"contents": [{"parts": [{"text": prompt}]}]},
+        timeout=gemini_timeout(deadline),
+    )
+
+
+async def agemini_generate(prompt, api_key, deadline=30):
+    """gemini_generate() on the event loop's AsyncClient"""
+    model = getattr(settings, "GEMINI_MODEL", "gemini-2.5-flash-lite")
+    return await get_async_http_client().post(
+        f"/v1beta/models/{model}:generateContent",
+        params={"key": api_key},
+        json={"contents": [{"parts": [{"text": prompt}]}]},
+        timeout=gemini_timeout(deadline),
+    )
@@ -0,0 +1,213 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from bot.catalog import get_catalog
+from bot.llm import close_http_client
+from bot.metrics import METRICS
+from bot.views import ANSWER_CACHE
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import concurrent.futures
+import json
+import random
+import threading
+import time
+
+FALLBACK = "Default Fallback Intent"
+LLM = "LLMQueryIntent"
+# (path label, intent, query) - realistic Dialogflow queries per webhook path
+DEFAULT_CORPUS = [
+    ("english", FALLBACK, "show me black nike shoes"),
+    ("english", FALLBACK, "do you have adidas samba in white"),
+    ("english", FALLBACK, "comfortable running shoes for daily use"),
+    ("english", FALLBACK, "which hoka shoes are available"),
+    ("english", FALLBACK, "new balance 550 sizes"),
+    ("roman_urdu", FALLBACK, "mujhe jordan dikhao"),
+    ("roman_urdu", FALLBACK, "kala joota chahiye office ke liye"),
+    ("roman_urdu", FALLBACK, "pao mein dard hai koi narm shoes batao"),
+    ("roman_urdu", FALLBACK, "delivery kitne din mein hogi"),
+    ("roman_urdu", FALLBACK, "contact number kia he"),
+    ("price", FALLBACK, "5000 se kam shoes"),
+    ("price", FALLBACK, "nike under 8k"),
+    ("price", FALLBACK, "10-15 hazar mein sneakers"),
+    ("price", FALLBACK, "between 6000 and 9000 adidas"),
+    ("price", FALLBACK, "20k se zyada premium shoes"),
+    ("llm_intent", LLM, "gift ke liye kaunse shoes best rahenge"),
+    ("llm_intent", LLM, "what is your return policy"),
+    ("llm_intent", LLM, "nike aur adidas mein kya farq hai"),
+    ("llm_intent", LLM, "sale chal rahi hai kya"),
+    ("llm_intent", LLM, "wedding ke liye formal shoes suggest karo"),
+]
+
+
+def dialogflow_payload(intent, query):
+    return {
+        "responseId": "bench",
+        "queryResult": {"queryText": query, "intent": {"displayName": intent}, "languageCode": "en"},
+    }
+
+
+def with_session(payload, name):
+    """Payload with its own Dialogflow session, so no replay sees another one's follow-up state"""
+    if payload.get("session"):
+        return payload
+    return {**payload, "session": f"projects/royaltrend/agent/sessions/{name}"}
+
+
+def load_corpus(path):
+    """JSONL corpus: {"path": label, "payload": {...Dialogflow body...}} per line"""
+    corpus = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                corpus.append((row.get("path", "default"), row["payload"]))
+    if not corpus:
+        raise CommandError(f"❌ Empty corpus: {path}")
+    return corpus
+
+
+def make_stub_handler(latency, error_rate, rng):
+    class StubGemini(BaseHTTPRequestHandler):
+        """Stand-in for generateContent with fixed latency and random 500s"""
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            if rng.random() < error_rate:
+                status, reply = 500, {"error": {"code": 500, "message": "stub error"}}
+            else:
+                status, reply = 200, {"candidates": [{"content": {"parts": [{"text": "Yeh rahe best options! Aapko size bataun?"}]}}]}
+            data = json.dumps(reply).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return StubGemini
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def summarize(latencies, errors, elapsed):
+    """Latency percentiles, and throughput over `elapsed` seconds"""
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else None,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 2) if values else None,
+        "p95_ms": round(percentile(values, 0.95) * 1000, 2) if values else None,
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2) if values else None,
+    }
+
+
+class Command(BaseCommand):
+    help = "Replay Dialogflow payloads through the webhook against a local stub Gemini and report latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", default=None, help='JSONL with {"path": ..., "payload": {...}} per line')
+        parser.add_argument("--rounds", type=int, default=5, help="Times the corpus is replayed")
+        parser.add_argument("--concurrency", type=int, default=4, help="Concurrent webhook clients")
+        parser.add_argument("--latency", type=float, default=0.5, help="Stub Gemini latency (seconds)")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub Gemini calls that return 500")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--keep-cache", action="store_true",
+            help="Do not clear the answer cache before each round (later rounds then measure cache hits)",
+        )
+        parser.add_argument("--output", default="benchmark_results.json", help="Where to save the JSON results")
+
+    def handle(self, *args, **kwargs):
+        if kwargs.get("corpus"):
+            corpus = load_corpus(kwargs["corpus"])
+        else:
+            corpus = [(label, dialogflow_payload(intent, query)) for label, intent, query in DEFAULT_CORPUS]
+        rng = random.Random(kwargs["seed"])
+        concurrency = max(1, kwargs["concurrency"])
+
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            make_stub_handler(kwargs["latency"], kwargs["error_rate"], random.Random(kwargs["seed"])),
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        local = threading.local()
+
+        def replay(job):
+            label, payload = job
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = Client(HTTP_HOST="127.0.0.1")
+            start = time.perf_counter()
+            response = client.post("/webhook/", json.dumps(payload), content_type="application/json")
+            elapsed = time.perf_counter() - start
+            ok = response.status_code == 200 and bool(response.json().get("fulfillmentText"))
+            return label, elapsed, ok
+
+        get_catalog()  # build the snapshot before timing, so round one does not pay for it
+        results = []
+        counters_before = METRICS.snapshot()["counters"]
+        close_http_client()  # the shared client must point at the stub
+        try:
+            with override_settings(GEMINI_API_BASE=base, GEMINI_API_KEY="benchmark"):
+                start = time.perf_counter()
+                with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    for round_no in range(max(1, kwargs["rounds"])):
+                        # Each round starts cold unless --keep-cache, so rounds measure the same thing
+                        if not kwargs.get("keep_cache"):
+                            ANSWER_CACHE.clear()
+                        jobs = [(label, with_session(payload, f"bench-{round_no}-{i}"))
+                                for i, (label, payload) in enumerate(corpus)]
+                        rng.shuffle(jobs)
+                        results.extend(executor.map(replay, jobs))
+                elapsed = time.perf_counter() - start
+        finally:
+            close_http_client()
+            server.shutdown()
+            server.server_close()
+
+        by_path = {}
+        for label, seconds, ok in results:
+            by_path.setdefault(label, ([], []))
+            by_path[label][0].append(seconds)
+            by_path[label][1].append(ok)
+        counters = {
+            name: count - counters_before.get(name, 0)
+            for name, count in METRICS.snapshot()["counters"].items()
+            if count != counters_before.get(name, 0)
+        }
+        report = {
+            "config": {k: kwargs[k] for k in ("rounds", "concurrency", "latency", "error_rate", "seed", "keep_cache")},
+            "corpus_size": len(corpus),
+            "elapsed_s": round(elapsed, 3),
+            "overall": summarize([s for _, s, _ in results], sum(1 for *_, ok in results if not ok), elapsed),
+            # Paths share the workers, so a path's throughput is over its own time: the
+            # seconds its requests took, spread over the `concurrency` workers
+            "paths": {
+                label: summarize(latencies, oks.count(False), sum(latencies) / concurrency)
+                for label, (latencies, oks) in sorted(by_path.items())
+            },
+            "counters": counters,
+            "answer_cache": ANSWER_CACHE.stats(),
+        }
+        with open(kwargs["output"], "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+        overall = report["overall"]
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {overall['requests']} requests in {report['elapsed_s']}s ({overall['throughput_rps']} req/s)"
+        ))
+        for label, stats in report["paths"].items():
+            self.stdout.write(
+                f"⏱️ {label}: n={stats['requests']} p50={stats['p50_ms']}ms "
+                f"p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms errors={stats['errors']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"✅ Results saved to {kwargs['output']}"))
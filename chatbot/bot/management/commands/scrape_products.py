@@ -1,15 +1,151 @@
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from bot.models import Product
+from bot.catalog import CatalogSnapshot, bump_catalog_version, get_catalog_version, save_snapshot
+from bot.columnar import load_catalog_file, write_catalog_file
+from bot.knowledge import compact_pages, knowledge_paths, split_pages, write_knowledge
 import requests
 from bs4 import BeautifulSoup
+import concurrent.futures
 import csv
+import hashlib
+import json
+import os
+import time
+from decimal import Decimal
+
+PRODUCTS_URL = "https://royaltrend.pk/collections/all/products.json?limit=250&page="
+PRODUCT_FIELDS = ["title", "price", "image_url"]
+STATIC_PAGES = [
+    "https://royaltrend.pk/pages/about",
+    "https://royaltrend.pk/pages/contact",
+    "https://royaltrend.pk/collections/trending",
+    "https://royaltrend.pk/collections/new-arrivals",
+    "https://royaltrend.pk/collections/sale",
+    "https://royaltrend.pk/collections",
+    "https://royaltrend.pk/search"
+]
+
+
+def pages_content_path():
+    return getattr(settings, "PAGES_CONTENT_FILE", settings.BASE_DIR / "pages_content.txt")
+
+
+def pages_state_path():
+    # ETag / Last-Modified / hashes of each static page from the previous run
+    return getattr(settings, "PAGES_STATE_FILE", settings.BASE_DIR / "pages_state.json")
+
+
+def load_pages_state():
+    try:
+        with open(pages_state_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_pages_state(state):
+    tmp = f"{pages_state_path()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, pages_state_path())
+
+
+def product_fields(p):
+    """Shopify product JSON -> Product field values"""
+    return {
+        "title": p["title"],
+        "price": Decimal(str(p["variants"][0]["price"])).quantize(Decimal("0.01")),
+        "image_url": p["images"][0]["src"] if p["images"] else "",
+        "product_link": f"https://royaltrend.pk/products/{p['handle']}",
+    }
+
 
 class Command(BaseCommand):
     help = "Scrape Shopify products + pages and save to database and CSV"
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timings = {}  # phase -> seconds
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--incremental", action="store_true",
+            help="Fetch pages concurrently and only insert/update/delete changed products in one transaction",
+        )
+        parser.add_argument(
+            "--compact-only", action="store_true",
+            help="Only rebuild the compact knowledge files from the existing pages_content.txt",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=4,
+            help="Concurrent page fetches (products.json in incremental mode, and static pages)",
+        )
+
     def handle(self, *args, **kwargs):
+        self.timings = {}
+
+        if kwargs.get("compact_only"):
+            with open(pages_content_path(), "r", encoding="utf-8") as f:
+                self.write_knowledge(split_pages(f.read()))
+            self.publish_catalog()
+            return
+
         # 1️⃣ PRODUCTS SCRAPING
-        base_url = "https://royaltrend.pk/collections/all/products.json?limit=250&page="
+        if kwargs.get("incremental"):
+            all_products, products_changed = self.scrape_products_incremental(kwargs.get("workers") or 4)
+        else:
+            all_products, products_changed = self.scrape_products_full(), True
+
+        # 🔄 Export to CSV
+        if all_products:
+            with self.timed("csv"):
+                with open("products.csv", "w", newline="", encoding="utf-8") as csvfile:
+                    writer = csv.writer(csvfile)
+                    writer.writerow(["Title", "Price", "Image_URL", "Product_Link"])
+                    writer.writerows(all_products)
+            self.stdout.write(self.style.SUCCESS("✅ Products exported to products.csv"))
+
+        # 2️⃣ STATIC PAGES SCRAPING
+        with self.timed("pages"):
+            pages_changed = self.scrape_static_pages(kwargs.get("workers") or 4)
+
+        # 🔄 Naya catalog version sirf tab, jab products ya pages waqai badle hon
+        if products_changed or pages_changed:
+            version = self.publish_catalog()
+            self.stdout.write(self.style.SUCCESS(f"✅ Catalog version updated: {version}"))
+        else:
+            if load_catalog_file(get_catalog_version()) is None:
+                with self.timed("catalog_file"):
+                    self.write_catalog_file(get_catalog_version())
+            self.stdout.write(self.style.SUCCESS("✅ Nothing changed, catalog version kept."))
+
+        for phase, seconds in self.timings.items():
+            self.stdout.write(f"⏱️ {phase}: {seconds:.2f}s")
+
+    def publish_catalog(self):
+        """Write the columnar catalog file and snapshot for a new version, then switch the version marker"""
+        version = str(time.time_ns())
+        with self.timed("catalog_file"):
+            self.write_catalog_file(version)
+        # 🔥 Prebuilt snapshot (search indexes included) so fresh workers start warm
+        with self.timed("snapshot"):
+            path = save_snapshot(CatalogSnapshot.load(version))
+        self.stdout.write(self.style.SUCCESS(f"✅ Catalog snapshot written: {path}"))
+        return bump_catalog_version(version)
+
+    def write_catalog_file(self, version):
+        # 📦 Compact catalog that every worker memory-maps instead of loading model instances
+        rows = Product.objects.order_by("id").values_list("id", "title", "price", "image_url", "product_link")
+        path = write_catalog_file(rows, version)
+        self.stdout.write(self.style.SUCCESS(f"✅ Catalog file written: {path} ({os.path.getsize(path)} bytes)"))
+
+    def timed(self, phase):
+        return PhaseTimer(self.timings, phase)
+
+    def scrape_products_full(self):
+        """Original mode: wipe the table and re-insert every product page by page"""
         page = 1
         total_products = 0
 
@@ -17,66 +153,191 @@ class Command(BaseCommand):
 
         all_products = []  # store for CSV export
 
-        while True:
-            url = f"{base_url}{page}"
-            response = requests.get(url)
-            if response.status_code != 200:
-                self.stdout.write(self.style.ERROR(f"❌ Failed to fetch page {page}"))
-                break
-
-            products = response.json().get("products", [])
-            if not products:
-                self.stdout.write(self.style.SUCCESS("✅ No more products found."))
-                break
-
-            for p in products:
-                product_obj = Product.objects.create(
-                    title=p["title"],
-                    price=p["variants"][0]["price"],
-                    image_url=p["images"][0]["src"] if p["images"] else "",
-                    product_link=f"https://royaltrend.pk/products/{p['handle']}"
-                )
-                all_products.append([
-                    product_obj.title,
-                    product_obj.price,
-                    product_obj.image_url,
-                    product_obj.product_link
-                ])
-
-            total_products += len(products)
-            self.stdout.write(self.style.SUCCESS(f"✅ Page {page} scraped ({len(products)} products)."))
-            page += 1
+        with self.timed("products"):
+            while True:
+                url = f"{PRODUCTS_URL}{page}"
+                response = requests.get(url)
+                if response.status_code != 200:
+                    self.stdout.write(self.style.ERROR(f"❌ Failed to fetch page {page}"))
+                    break
+
+                products = response.json().get("products", [])
+                if not products:
+                    self.stdout.write(self.style.SUCCESS("✅ No more products found."))
+                    break
+
+                for p in products:
+                    fields = product_fields(p)
+                    # product_link is unique; a product repeated across pages just updates its row
+                    product_obj, _ = Product.objects.update_or_create(
+                        product_link=fields["product_link"], defaults=fields
+                    )
+                    all_products.append([
+                        product_obj.title,
+                        product_obj.price,
+                        product_obj.image_url,
+                        product_obj.product_link
+                    ])
+
+                total_products += len(products)
+                self.stdout.write(self.style.SUCCESS(f"✅ Page {page} scraped ({len(products)} products)."))
+                page += 1
 
         self.stdout.write(self.style.SUCCESS(f"🎯 Total {total_products} products saved."))
+        return all_products
 
-        # 🔄 Export to CSV
-        if all_products:
-            with open("products.csv", "w", newline="", encoding="utf-8") as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(["Title", "Price", "Image_URL", "Product_Link"])
-                writer.writerows(all_products)
-            self.stdout.write(self.style.SUCCESS("✅ Products exported to products.csv"))
+    def fetch_all_pages(self, session, workers):
+        """Fetch products.json pages `workers` at a time until an empty page comes back"""
+        def fetch(page):
+            response = session.get(f"{PRODUCTS_URL}{page}", timeout=30)
+            if response.status_code != 200:
+                raise CommandError(f"❌ Failed to fetch page {page} (HTTP {response.status_code})")
+            return response.json().get("products", [])
 
-        # 2️⃣ STATIC PAGES SCRAPING
-        static_pages = [
-            "https://royaltrend.pk/pages/about",
-            "https://royaltrend.pk/pages/contact",
-            "https://royaltrend.pk/collections/trending",
-            "https://royaltrend.pk/collections/new-arrivals",
-            "https://royaltrend.pk/collections/sale",
-            "https://royaltrend.pk/collections",
-            "https://royaltrend.pk/search"
+        shopify_products = []
+        page = 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = list(executor.map(fetch, range(page, page + workers)))
+                for offset, products in enumerate(batch):
+                    if not products:
+                        self.stdout.write(self.style.SUCCESS("✅ No more products found."))
+                        return shopify_products
+                    shopify_products.extend(products)
+                    self.stdout.write(self.style.SUCCESS(
+                        f"✅ Page {page + offset} scraped ({len(products)} products)."
+                    ))
+                page += workers
+
+    def scrape_products_incremental(self, workers):
+        """Concurrent fetch + diff against existing rows; writes only the changes, atomically"""
+        # Any failed page aborts before the DB is touched, so a partial fetch never deletes products
+        with self.timed("fetch"):
+            with requests.Session() as session:
+                shopify_products = self.fetch_all_pages(session, max(1, workers))
+
+        with self.timed("diff"):
+            incoming = {}
+            for p in shopify_products:
+                fields = product_fields(p)
+                incoming[fields["product_link"]] = fields
+
+            existing = {obj.product_link: obj for obj in Product.objects.all()}
+            to_create, to_update = [], []
+            for link, fields in incoming.items():
+                obj = existing.get(link)
+                if obj is None:
+                    to_create.append(Product(**fields))
+                elif any(getattr(obj, name) != fields[name] for name in PRODUCT_FIELDS):
+                    for name in PRODUCT_FIELDS:
+                        setattr(obj, name, fields[name])
+                    to_update.append(obj)
+            to_delete = [obj.pk for link, obj in existing.items() if link not in incoming]
+
+        with self.timed("write"):
+            with transaction.atomic():
+                Product.objects.bulk_create(to_create, batch_size=500)
+                Product.objects.bulk_update(to_update, PRODUCT_FIELDS, batch_size=500)
+                for i in range(0, len(to_delete), 500):
+                    Product.objects.filter(pk__in=to_delete[i:i + 500]).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🎯 Total {len(incoming)} products: {len(to_create)} added, "
+            f"{len(to_update)} updated, {len(to_delete)} removed."
+        ))
+        rows = [
+            [f["title"], f["price"], f["image_url"], f["product_link"]]
+            for f in incoming.values()
         ]
+        return rows, bool(to_create or to_update or to_delete)
+
+    def scrape_static_pages(self, workers):
+        """Fetch static pages in parallel with conditional requests; returns True if the text changed"""
+        state = load_pages_state()
+        pages = state.get("pages", {})
+
+        def fetch(session, page_url):
+            cached = pages.get(page_url, {})
+            headers = {}
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+            resp = session.get(page_url, headers=headers, timeout=30)
+            if resp.status_code == 304 and "text" in cached:
+                return page_url, cached, "not modified"
+            if resp.status_code != 200:
+                return page_url, cached if "text" in cached else None, f"HTTP {resp.status_code}"
+
+            entry = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "html_hash": hashlib.sha256(resp.content).hexdigest(),
+            }
+            if entry["html_hash"] == cached.get("html_hash") and "text" in cached:
+                # Same bytes as last time, no need to parse again
+                return page_url, {**cached, **entry}, "unchanged"
+            soup = BeautifulSoup(resp.text, "html.parser")
+            entry["text"] = soup.get_text(separator="\n", strip=True)
+            return page_url, entry, "parsed"
+
+        with requests.Session() as session:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                results = list(executor.map(lambda url: fetch(session, url), STATIC_PAGES))
+
+        new_pages = {}
+        for page_url, entry, status in results:
+            if entry is None:
+                self.stdout.write(self.style.ERROR(f"❌ Failed to fetch: {page_url} ({status})"))
+                continue
+            if status.startswith("HTTP"):
+                self.stdout.write(self.style.ERROR(f"❌ Failed to fetch: {page_url} ({status}), keeping old copy"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"📄 {page_url}: {status}"))
+            new_pages[page_url] = entry
+
+        content = "".join(
+            f"==== {url} ====\n{new_pages[url]['text']}\n\n" for url in STATIC_PAGES if url in new_pages
+        )
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        changed = content_hash != state.get("content_hash") or not os.path.exists(pages_content_path())
+        if changed:
+            with open(pages_content_path(), "w", encoding="utf-8") as f:
+                f.write(content)
+            self.stdout.write(self.style.SUCCESS(f"✅ Static pages content saved to {pages_content_path()}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Static pages unchanged, pages_content.txt not rewritten"))
+
+        # 🧹 Compact knowledge base (boilerplate hata ke, sections ke sath)
+        if changed or not all(os.path.exists(path) for path in knowledge_paths()):
+            with self.timed("compact"):
+                self.write_knowledge({url: entry["text"] for url, entry in new_pages.items()})
+
+        save_pages_state({"content_hash": content_hash, "pages": new_pages})
+        return changed
+
+    def write_knowledge(self, pages):
+        sections = compact_pages(pages)
+        write_knowledge(sections)
+        size = sum(len(text) for _, _, text in sections)
+        raw = sum(len(text) for text in pages.values())
+        blob_path, index_path = knowledge_paths()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Knowledge base: {len(sections)} sections, {raw} -> {size} chars ({blob_path}, {index_path})"
+        ))
+
+
+class PhaseTimer:
+    """Context manager that adds the elapsed time of a phase to a timings dict"""
+
+    def __init__(self, timings, phase):
+        self.timings = timings
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
 
-        with open("pages_content.txt", "w", encoding="utf-8") as f:
-            for page_url in static_pages:
-                resp = requests.get(page_url)
-                if resp.status_code == 200:
-                    soup = BeautifulSoup(resp.text, "html.parser")
-                    page_text = soup.get_text(separator="\n", strip=True)
-                    f.write(f"==== {page_url} ====\n{page_text}\n\n")
-                    self.stdout.write(self.style.SUCCESS(f"📄 Saved content from: {page_url}"))
-                else:
-                    self.stdout.write(self.style.ERROR(f"❌ Failed to fetch: {page_url}"))
-        
-        self.stdout.write(self.style.SUCCESS("✅ Static pages content saved to pages_content.txt"))
+    def __exit__(self, *exc):
+        self.timings[self.phase] = self.timings.get(self.phase, 0) + time.perf_counter() - self.start
+        return False
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from bot.intents import INTENTS, NaiveBayesIntentModel
+import json
+
+
+class Command(BaseCommand):
+    help = "Train the local intent classifier from logged queries (JSONL with query + intent)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("logfile", help='JSONL file, one {"query": ..., "intent": ...} per line')
+        parser.add_argument(
+            "--output", default=None,
+            help="Model file to write (default: settings.INTENT_MODEL_FILE, intent_model.json in BASE_DIR)",
+        )
+
+    def handle(self, *args, **kwargs):
+        examples = []
+        with open(kwargs["logfile"], "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                intent = row.get("intent") or "other"
+                # Anything we have no template for is "other" (goes to the LLM)
+                examples.append((row["query"], intent if intent in INTENTS else "other"))
+
+        if not examples:
+            raise CommandError("❌ No labelled queries found.")
+
+        model = NaiveBayesIntentModel.train(examples)
+        output = kwargs.get("output") or getattr(settings, "INTENT_MODEL_FILE", settings.BASE_DIR / "intent_model.json")
+        model.save(output)
+        counts = {}
+        for _, intent in examples:
+            counts[intent] = counts.get(intent, 0) + 1
+        self.stdout.write(self.style.SUCCESS(f"✅ Trained on {len(examples)} queries {counts} -> {output}"))
@@ -0,0 +1,123 @@
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger("bot")
+
+
+class Histogram:
+    """Count/sum of every observation plus a window of recent ones for percentiles"""
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+    def summary(self):
+        values = sorted(self.recent)
+        if not values:
+            return {"count": self.count}
+
+        def pct(q):
+            return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2)
+
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+        }
+
+
+class Metrics:
+    """In-process stage histograms and counters"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.histograms = {}
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram(self.window)
+            hist.observe(seconds)
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stages": {name: hist.summary() for name, hist in sorted(self.histograms.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+METRICS = Metrics()
+# (start, {stage: seconds}) of the current request; a context variable so that
+# concurrent requests on one event loop each get their own breakdown
+_REQUEST = contextvars.ContextVar("bot_request", default=None)
+
+
+def begin_request():
+    """Start collecting stage timings for the current request"""
+    _REQUEST.set((time.perf_counter(), {}))
+
+
+def end_request():
+    """Record the request total and return {stage: ms} for this request"""
+    current = _REQUEST.get()
+    if current is None:
+        return {}
+    start, stages = current
+    total = time.perf_counter() - start
+    METRICS.observe("total", total)
+    _REQUEST.set(None)
+    result = {stage: round(seconds * 1000, 2) for stage, seconds in stages.items()}
+    result["total"] = round(total * 1000, 2)
+    return result
+
+
+@contextmanager
+def timed(stage):
+    """Time a block into the stage histogram (and the current request's breakdown)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        METRICS.observe(stage, elapsed)
+        current = _REQUEST.get()
+        if current is not None:
+            current[1][stage] = current[1].get(stage, 0) + elapsed
+
+
+def log_event(level, event, exc_info=False, sampled=True, **fields):
+    """One JSON log line; below WARNING only a LOG_SAMPLE_RATE share of events is written (unless sampled=False)"""
+    if not logger.isEnabledFor(level):
+        return
+    if sampled and level < logging.WARNING and random.random() >= getattr(settings, "LOG_SAMPLE_RATE", 0.1):
+        return
+    logger.log(level, json.dumps({"event": event, **fields}, ensure_ascii=False, default=str), exc_info=exc_info)
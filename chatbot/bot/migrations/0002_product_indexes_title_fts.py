@@ -0,0 +1,59 @@
+from django.db import migrations, models
+
+# External-content FTS5 index over Product.title, kept in sync by triggers so the
+# scraper's create / bulk_create / bulk_update / delete calls update it too.
+# NOTE: SQLite rebuilds bot_product on AlterField, which drops these triggers;
+# a later migration that alters Product must run CREATE_FTS again.
+CREATE_FTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS bot_product_fts USING fts5(
+        title, content='bot_product', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS bot_product_fts_ai AFTER INSERT ON bot_product BEGIN
+        INSERT INTO bot_product_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bot_product_fts_ad AFTER DELETE ON bot_product BEGIN
+        INSERT INTO bot_product_fts(bot_product_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bot_product_fts_au AFTER UPDATE OF title ON bot_product BEGIN
+        INSERT INTO bot_product_fts(bot_product_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO bot_product_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    "INSERT INTO bot_product_fts(bot_product_fts) VALUES ('rebuild')",
+]
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS bot_product_fts_ai",
+    "DROP TRIGGER IF EXISTS bot_product_fts_ad",
+    "DROP TRIGGER IF EXISTS bot_product_fts_au",
+    "DROP TABLE IF EXISTS bot_product_fts",
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only; other databases use the icontains fallback in bot/dbsearch.py
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=models.DecimalField(db_index=True, decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='product_link',
+            field=models.URLField(unique=True),
+        ),
+        migrations.RunPython(run_sqlite(CREATE_FTS), run_sqlite(DROP_FTS)),
+    ]
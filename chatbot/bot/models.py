@@ -2,9 +2,9 @@ from django.db import models
 
 class Product(models.Model):
     title = models.CharField(max_length=255)
-    price = models.DecimalField(max_digits=10, decimal_places=2)
+    price = models.DecimalField(max_digits=10, decimal_places=2, db_index=True)
     image_url = models.URLField()
-    product_link = models.URLField()
+    product_link = models.URLField(unique=True)
 
     def __str__(self):
         return self.title
@@ -0,0 +1,94 @@
+import re
+
+# Amount with optional k / hazar / lakh suffix: "5000", "5k", "1.5k", "10 hazar", "2 lakh"
+AMOUNT = r"(\d+(?:\.\d+)?)(k\b|\s*(?:thousand|hazar|hazaar|hzr|hazr|lakh|lac)\b)?"
+MULTIPLIERS = {
+    "k": 1000, "thousand": 1000, "hazar": 1000, "hazaar": 1000, "hzr": 1000, "hazr": 1000,
+    "lakh": 100000, "lac": 100000,
+}
+CURRENCY = r"(?:rs\.?|pkr|₨)\s*"
+
+RANGE_RES = [
+    # "10-15 hazar", "5000 to 8000", "5k se 8k", "5000 sy 8000 tak"
+    re.compile(rf"(?:{CURRENCY})?{AMOUNT}\s*(?:-|–|to|se|sy|say)\s*(?:{CURRENCY})?{AMOUNT}"),
+    # "between 5000 and 8000", "5000 aur 8000 ke beech"
+    re.compile(rf"between\s+(?:{CURRENCY})?{AMOUNT}\s*(?:and|&)\s*(?:{CURRENCY})?{AMOUNT}"),
+    re.compile(rf"(?:{CURRENCY})?{AMOUNT}\s*(?:aur|or|and)\s*(?:{CURRENCY})?{AMOUNT}\s*(?:ke|k)?\s*(?:beech|bech|darmiyan)"),
+]
+UPPER_BEFORE_RE = re.compile(
+    rf"(?:under|below|less than|within|upto|up to|budget|not more than|andar)\s*(?:{CURRENCY})?{AMOUNT}"
+)
+# "max 15k" / "max Rs 9000" is a budget, "Air Max 720" / "Air Max 97" is a model:
+# only counted with a currency word or an amount suffix
+MAX_BEFORE_RE = re.compile(rf"\b(?:max|maximum)\s*({CURRENCY})?{AMOUNT}")
+UPPER_AFTER_RE = re.compile(
+    rf"(?:{CURRENCY})?{AMOUNT}\s*(?:se|sy|say|tak|ke|k)?\s*(?:kam|km|neeche|niche|tak|andar|under|or less|max)\b"
+)
+LOWER_BEFORE_RE = re.compile(
+    rf"(?:above|over|more than|min|minimum|starting|starting from|from)\s*(?:{CURRENCY})?{AMOUNT}"
+)
+LOWER_AFTER_RE = re.compile(
+    rf"(?:{CURRENCY})?{AMOUNT}\s*(?:se|sy|say|ke|k)?\s*(?:zyada|ziada|zaida|zyda|upar|oper|uper|above|plus|\+|or more)"
+)
+BARE_AMOUNT_RE = re.compile(rf"({CURRENCY})?{AMOUNT}")
+# Amounts below these are sizes (42) or model numbers (Air Max 90), not prices
+MIN_PRICE = 500
+MIN_BARE_PRICE = 1000
+
+
+def to_amount(number, suffix):
+    return int(round(float(number) * MULTIPLIERS.get((suffix or "").strip(), 1)))
+
+
+def first_amount(regexes, text):
+    """First amount of at least MIN_PRICE matched by any of the regexes, in order"""
+    for regex in regexes:
+        for match in regex.finditer(text):
+            amount = to_amount(*match.groups())
+            if amount >= MIN_PRICE:
+                return amount
+    return None
+
+
+def max_budget(text):
+    """"max 15k" / "maximum Rs 9000", but not the "max 720" of an Air Max model"""
+    for match in MAX_BEFORE_RE.finditer(text):
+        currency, number, suffix = match.groups()
+        if (currency or suffix) and to_amount(number, suffix) >= MIN_PRICE:
+            return to_amount(number, suffix)
+    return None
+
+
+def parse_price_intent(text):
+    """Parse a price intent from English / Roman Urdu text.
+
+    Returns (low, high); either bound may be None. (None, None) means no
+    price intent was found.
+    """
+    text = (text or "").lower().replace(",", "")
+
+    # Every match is tried: in "air max 97 under 15k" the first hit is a model number
+    for regex in RANGE_RES:
+        for match in regex.finditer(text):
+            n1, s1, n2, s2 = match.groups()
+            # "10-15 hazar": a suffix on the second number applies to both
+            low, high = to_amount(n1, s1 or s2), to_amount(n2, s2)
+            if max(low, high) >= MIN_PRICE:
+                return min(low, high), max(low, high)
+
+    high = first_amount((UPPER_BEFORE_RE, UPPER_AFTER_RE), text)
+    if high is None:
+        high = max_budget(text)
+    low = first_amount((LOWER_BEFORE_RE, LOWER_AFTER_RE), text)
+    if low is not None or high is not None:
+        return low, high
+
+    # Old behaviour: two price-looking numbers form a range
+    amounts = [
+        to_amount(number, suffix)
+        for currency, number, suffix in BARE_AMOUNT_RE.findall(text)
+        if suffix or currency or float(number) >= MIN_BARE_PRICE
+    ]
+    if len(amounts) >= 2:
+        return min(amounts[:2]), max(amounts[:2])
+    return None, None
@@ -0,0 +1,111 @@
+import contextlib
+import cProfile
+import functools
+import inspect
+import io
+import itertools
+import marshal
+import pstats
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+PROFILE_HEADER = "HTTP_X_PROFILE_SECRET"
+# Lines of the text report kept per profile
+REPORT_LINES = 40
+
+
+class ProfileStore:
+    """Ring buffer with the last N request profiles"""
+
+    def __init__(self, maxlen=20):
+        self.profiles = deque(maxlen=maxlen)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, path, reason, duration, profiler):
+        profiler.create_stats()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(REPORT_LINES)
+        entry = {
+            "id": next(self._ids),
+            "path": path,
+            "reason": reason,
+            "started_at": time.time() - duration,
+            "duration_ms": round(duration * 1000, 2),
+            "report": out.getvalue(),
+            # Same format as pstats.Stats.dump_stats(), so the download opens in pstats/snakeviz
+            "data": marshal.dumps(profiler.stats),
+        }
+        with self._lock:
+            self.profiles.append(entry)
+        return entry
+
+    def get(self, profile_id):
+        with self._lock:
+            return next((p for p in self.profiles if p["id"] == profile_id), None)
+
+    def list(self):
+        with self._lock:
+            return [{k: v for k, v in p.items() if k not in ("report", "data")} for p in self.profiles]
+
+
+PROFILES = ProfileStore(maxlen=getattr(settings, "PROFILING_KEEP", 20))
+# Only one cProfile can be active per process, concurrent requests run unprofiled
+_PROFILE_LOCK = threading.Lock()
+
+
+def profile_reason(request):
+    """Why this request should be profiled ("header" / "sample"), or None"""
+    secret = getattr(settings, "PROFILING_SECRET", "")
+    if secret and request.META.get(PROFILE_HEADER) == secret:
+        return "header"
+    if random.random() < getattr(settings, "PROFILING_SAMPLE_RATE", 0.0):
+        return "sample"
+    return None
+
+
+@contextlib.contextmanager
+def profiling(request):
+    """cProfile the block if this request is picked and no other profile is running"""
+    reason = profile_reason(request) if getattr(settings, "PROFILING_ENABLED", False) else None
+    if reason is None or not _PROFILE_LOCK.acquire(blocking=False):
+        yield
+        return
+    try:
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            PROFILES.add(request.path, reason, time.perf_counter() - start, profiler)
+    finally:
+        _PROFILE_LOCK.release()
+
+
+def profiled(view):
+    """Opt-in cProfile capture for a view (PROFILING_ENABLED + sample rate or secret header).
+
+    Async views are profiled across their awaits on the event loop thread, so
+    the report also shows whatever else the loop ran meanwhile, and not the
+    work handed to sync_to_async threads.
+    """
+    if inspect.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with profiling(request):
+                return await view(request, *args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with profiling(request):
+            return view(request, *args, **kwargs)
+
+    return wrapper
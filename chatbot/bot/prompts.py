@@ -0,0 +1,142 @@
+import threading
+from collections import deque
+
+from django.conf import settings
+
+from bot.cache import normalize_query
+
+# Fixed instructions, built once per process instead of on every call
+PROMPT_PREFIX = """You are a friendly **sales agent** for Royal Trend.
+
+📝 RULES:
+- Always reply in same language as user query.
+- Always reply in same language as user query(English and Roman Urdu).
+- If language is "urdu", reply in Roman Urdu (English alphabets only).
+- If language is "English", reply in English.
+- Keep replies short (3-6 lines), friendly & casual like WhatsApp chat.
+- No long paragraphs or formal tone., not like a long email.
+- Do NOT always start with "Assalamu Alaikum", use it rarely or skip.
+- If user asks for products, show max 2-3 best suggestions only.
+- End with a small question or call-to-action: e.g. "Aapko size bataun?" or "Aur options chahiye?"
+- If price range is given, suggest only products from that range.
+- If user mentions foot pain, suggest comfortable/orthopedic shoes.
+- No long paragraphs, just short helpful sentences.
+- **Reply to the user as fast as possible, ideally within 3 seconds.**
+"""
+# Dynamic sections in the order they get budget; what one leaves unused goes to the next
+SECTION_SHARES = (("products", 0.45), ("website", 0.35), ("brands", 0.20))
+SECTION_TITLES = {"website": "Website Content", "brands": "Available Brands", "products": "Sample Products"}
+# Rough chars-per-token ratio, only used for the size estimate we record
+CHARS_PER_TOKEN = 4
+
+
+def product_line(p):
+    return f"{p.title} - Rs. {getattr(p, 'price', 'N/A')}"
+
+
+def truncate(line, limit):
+    """Cut a line at `limit` chars on a ", " or word boundary"""
+    if len(line) <= limit:
+        return line
+    cut = line[:limit]
+    for sep in (", ", " "):
+        idx = cut.rfind(sep)
+        if idx > limit // 2:
+            return cut[:idx]
+    return cut
+
+
+def rank_lines(lines, query_words):
+    """Line indexes by how many query words they contain; ties keep the incoming order"""
+    scores = [len(query_words & set(normalize_query(line).split())) for line in lines]
+    return sorted(range(len(lines)), key=lambda i: -scores[i])
+
+
+def fit_lines(lines, query_words, budget, max_lines=None, keep_order=False):
+    """Most relevant lines that fit in `budget` chars (the last one may be truncated)"""
+    chosen, used = [], 0
+    for idx in rank_lines(lines, query_words)[:max_lines]:
+        line = lines[idx]
+        room = budget - used
+        if room <= 0:
+            break
+        if len(line) + 1 > room:
+            if chosen and room < 40:
+                break
+            line = truncate(line, room - 1)
+        chosen.append((idx, line))
+        used += len(line) + 1
+    if keep_order:
+        chosen.sort()
+    return [line for _, line in chosen]
+
+
+class PromptSizes:
+    """Recent prompt sizes per section, for tuning the budget"""
+
+    def __init__(self, window=500):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, sizes):
+        with self._lock:
+            self.samples.append(sizes)
+
+    def stats(self):
+        with self._lock:
+            samples = list(self.samples)
+        if not samples:
+            return {"calls": 0}
+        result = {"calls": len(samples)}
+        for key in samples[-1]:
+            values = sorted(s[key] for s in samples)
+            result[key] = {
+                "avg": round(sum(values) / len(values), 1),
+                "p95": values[min(len(values) - 1, int(0.95 * len(values)))],
+            }
+        return result
+
+
+PROMPT_SIZES = PromptSizes()
+
+
+def build_prompt(user_query, website_content, products, brands, budget=None):
+    """Static prefix + dynamic sections ranked and cut to fit `budget` characters.
+
+    Returns (prompt, sizes) where sizes has the character count of every
+    section, the total and a token estimate.
+    """
+    if budget is None:
+        budget = getattr(settings, "PROMPT_BUDGET", 3000)
+    query_words = set(normalize_query(user_query).split())
+    candidates = {
+        "products": [product_line(p) for p in products],
+        "website": [line for line in (website_content or "").splitlines() if line.strip()],
+        "brands": [line for line in (brands or "").splitlines() if line.strip()],
+    }
+    max_products = getattr(settings, "PROMPT_MAX_PRODUCTS", 10)
+
+    sections, carry = {}, 0
+    for name, share in SECTION_SHARES:
+        section_budget = int(budget * share) + carry
+        lines = fit_lines(
+            candidates[name], query_words, section_budget,
+            max_lines=max_products if name == "products" else None,
+            # Website passages read better in page order
+            keep_order=name == "website",
+        )
+        sections[name] = "\n".join(lines)
+        carry = max(section_budget - len(sections[name]), 0)
+
+    prompt = (
+        f"{PROMPT_PREFIX}\n"
+        f"{SECTION_TITLES['website']}:\n{sections['website']}\n\n"
+        f"{SECTION_TITLES['brands']}:\n{sections['brands']}\n\n"
+        f"{SECTION_TITLES['products']}:\n{sections['products']}\n\n"
+        f"User asked: {user_query}\n"
+    )
+    sizes = {name: len(text) for name, text in sections.items()}
+    sizes.update(prefix=len(PROMPT_PREFIX), query=len(user_query), total=len(prompt),
+                 est_tokens=len(prompt) // CHARS_PER_TOKEN)
+    PROMPT_SIZES.record(sizes)
+    return prompt, sizes
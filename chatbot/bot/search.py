@@ -0,0 +1,276 @@
+import bisect
+import heapq
+import math
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Minimum trigram Dice similarity for a query word to match a title word
+# ("nikee" -> "nike", "addidas" -> "adidas").
+FUZZY_THRESHOLD = 0.5
+# Hard cap on postings walked per matched word so very common words
+# ("nike", "shoes") stay cheap on a large catalog.
+MAX_POSTINGS = 500
+MIN_SCORE = 0.15
+# Query words that never narrow a title search: English stopwords, Roman Urdu
+# filler and generic product/price words ("shoes kya hai", "nike under 8k").
+# Both the in-memory index and the FTS5 MATCH drop them, so the two search
+# modes agree on filler-only queries (no products, the LLM answers).
+STOPWORDS = frozenset({
+    "a", "an", "the", "is", "are", "am", "do", "does", "you", "your", "have", "has", "i", "me", "my", "for",
+    "of", "in", "with", "and", "or", "to", "any", "some", "please", "show", "want", "need", "what", "which",
+    "how", "much", "many", "there", "it", "this", "that", "these", "can", "get", "give", "available",
+    "kya", "kia", "kiya", "hai", "he", "hy", "hain", "hein", "ke", "ki", "ka", "ko", "mein", "mai", "se",
+    "aur", "ya", "koi", "kuch", "bhi", "mujhe", "muje", "chahiye", "dikhao", "dikha", "batao", "bata",
+    "wala", "wali", "wale", "aap", "ap", "pe", "par", "tak", "kitne", "kitna", "kitni", "hoga", "milega",
+    "shoes", "shoe", "joota", "jootay", "juta", "jutay", "product", "products", "item", "items",
+    "price", "rate", "cost", "under", "above", "below", "between", "kam", "zyada", "hazar", "rs", "rupees",
+    "budget",
+})
+
+
+def tokenize(text):
+    """Lowercase text and split it into alphanumeric words"""
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def query_words(text):
+    """Query words that can narrow a title search (tokenize() minus STOPWORDS)"""
+    return [w for w in tokenize(text) if w not in STOPWORDS]
+
+
+def trigrams(word):
+    """Character trigrams of a word, padded so prefixes/suffixes count"""
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductIndex:
+    """Inverted index over product title words with a trigram index over the vocabulary.
+
+    Queries are matched word by word: each query word is expanded to similar
+    title words through the trigram postings, and products are scored only
+    from the postings of those words (cosine over IDF weights).
+    """
+
+    def __init__(self, products):
+        self.products = list(products)
+        self.prices = []
+        doc_tokens = []
+        df = defaultdict(int)
+        for p in self.products:
+            try:
+                self.prices.append(float(p.price))
+            except (TypeError, ValueError):
+                self.prices.append(None)
+            tokens = set(tokenize(p.title))
+            doc_tokens.append(tokens)
+            for t in tokens:
+                df[t] += 1
+
+        n = len(self.products)
+        self.idf = {t: math.log((n + 1) / c) + 1.0 for t, c in df.items()}
+        self.unknown_idf = math.log(n + 1) + 1.0
+
+        # word -> [(weight, product_idx)] sorted by weight, best first
+        postings = defaultdict(list)
+        for idx, tokens in enumerate(doc_tokens):
+            norm = math.sqrt(sum(self.idf[t] ** 2 for t in tokens)) or 1.0
+            for t in tokens:
+                postings[t].append((self.idf[t] ** 2 / norm, idx))
+        self.postings = {t: sorted(lst, reverse=True) for t, lst in postings.items()}
+
+        # trigram -> vocabulary words containing it
+        self.vocab_trigrams = {}
+        gram_postings = defaultdict(list)
+        for t in self.postings:
+            grams = trigrams(t)
+            self.vocab_trigrams[t] = len(grams)
+            if len(t) > 2:
+                for g in grams:
+                    gram_postings[g].append(t)
+        self.gram_postings = dict(gram_postings)
+
+    def __len__(self):
+        return len(self.products)
+
+    def similar_words(self, word):
+        """Return [(vocab_word, similarity)] for a query word"""
+        if word in self.postings:
+            return [(word, 1.0)]
+        if len(word) <= 2:
+            return []
+        grams = trigrams(word)
+        shared = defaultdict(int)
+        for g in grams:
+            for t in self.gram_postings.get(g, ()):
+                shared[t] += 1
+        matches = []
+        for t, common in shared.items():
+            sim = 2.0 * common / (len(grams) + self.vocab_trigrams[t])
+            if sim >= FUZZY_THRESHOLD:
+                matches.append((t, sim))
+        return matches
+
+    def search(self, query, limit=10, low=None, high=None):
+        """Return the top `limit` products for a query, optionally within a price range"""
+        words = set(query_words(query))
+        if not words or not self.products:
+            return []
+
+        scores = defaultdict(float)
+        query_norm = 0.0
+        for w in words:
+            matches = self.similar_words(w)
+            query_norm += max((self.idf[t] for t, _ in matches), default=self.unknown_idf) ** 2
+            for t, sim in matches:
+                for weight, idx in self.postings[t][:MAX_POSTINGS]:
+                    scores[idx] += sim * weight
+
+        query_norm = math.sqrt(query_norm) or 1.0
+        price_filter = low is not None or high is not None
+        ranked = []
+        for idx, score in scores.items():
+            score /= query_norm
+            if score <= MIN_SCORE:
+                continue
+            if price_filter:
+                price = self.prices[idx]
+                if price is not None and (
+                    (low is not None and price < low) or (high is not None and price > high)
+                ):
+                    continue
+            ranked.append((score, -idx))
+        top = heapq.nlargest(limit, ranked)
+        return [self.products[-neg_idx] for _, neg_idx in top]
+
+
+class PriceIndex:
+    """Products sorted by price, for bisect range lookups without touching the DB"""
+
+    def __init__(self, products):
+        priced = []
+        for p in products:
+            try:
+                priced.append((float(p.price), p))
+            except (TypeError, ValueError):
+                continue
+        priced.sort(key=lambda item: item[0])
+        self.prices = [price for price, _ in priced]
+        self.products = [p for _, p in priced]
+
+    def __len__(self):
+        return len(self.products)
+
+    def between(self, low=None, high=None, limit=5):
+        """Products priced in [low, high].
+
+        Cheapest first, except for "under X" queries (no lower bound), where
+        the closest to the budget come first.
+        """
+        start = 0 if low is None else bisect.bisect_left(self.prices, low)
+        end = len(self.prices) if high is None else bisect.bisect_right(self.prices, high)
+        if start >= end:
+            return []
+        if low is None and high is not None:
+            return self.products[max(start, end - limit):end][::-1]
+        return self.products[start:min(end, start + limit)]
+
+
+def hashed_features(text, n_features):
+    """Hashed word unigrams + character trigrams of a text -> {feature: count}"""
+    counts = defaultdict(float)
+    for word in tokenize(text):
+        counts[zlib.crc32(b"w:" + word.encode()) % n_features] += 1.0
+        for gram in trigrams(word):
+            counts[zlib.crc32(b"c:" + gram.encode()) % n_features] += 1.0
+    return counts
+
+
+class VectorRanker:
+    """TF-IDF cosine ranking over hashed word/char n-grams, vectorized with NumPy.
+
+    The title matrix is stored column-wise (feature -> rows, weights), so scoring
+    a query is one sparse matrix-vector product done with np.bincount, followed
+    by a boolean price mask and argpartition for the top-k.
+    """
+
+    def __init__(self, products, n_features=2 ** 18):
+        self.products = tuple(products)
+        self.n_features = n_features
+        n = len(self.products)
+        self.prices = np.array(
+            [float(p.price) if p.price is not None else np.nan for p in self.products], dtype=np.float64
+        )
+
+        rows, cols, vals = [], [], []
+        for idx, p in enumerate(self.products):
+            for feature, count in hashed_features(p.title, n_features).items():
+                rows.append(idx)
+                cols.append(feature)
+                vals.append(count)
+        rows = np.array(rows, dtype=np.int32)
+        cols = np.array(cols, dtype=np.int64)
+        vals = np.array(vals, dtype=np.float32)
+
+        df = np.bincount(cols, minlength=n_features)
+        self.idf = np.log((n + 1) / (df + 1)).astype(np.float32) + 1.0
+        vals = (1.0 + np.log(vals)) * self.idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=vals.astype(np.float64) ** 2, minlength=n))
+        vals = (vals / np.where(norms == 0, 1.0, norms)[rows]).astype(np.float32)
+
+        order = np.argsort(cols, kind="stable")
+        self.indices = rows[order]
+        self.data = vals[order]
+        self.indptr = np.zeros(n_features + 1, dtype=np.int64)
+        np.cumsum(df, out=self.indptr[1:])
+
+    def __len__(self):
+        return len(self.products)
+
+    def price_mask(self, low=None, high=None):
+        """Boolean vector of products inside [low, high] (unknown prices always pass)"""
+        mask = np.ones(len(self.products), dtype=bool)
+        if low is not None:
+            mask &= ~(self.prices < low)
+        if high is not None:
+            mask &= ~(self.prices > high)
+        return mask
+
+    def scores(self, query):
+        """Cosine similarity of every product title to the query"""
+        n = len(self.products)
+        query_features = hashed_features(query, self.n_features)
+        if not query_features or not n:
+            return np.zeros(n, dtype=np.float64)
+        features = np.fromiter(query_features.keys(), dtype=np.int64)
+        weights = (1.0 + np.log(np.fromiter(query_features.values(), dtype=np.float64))) * self.idf[features]
+        weights /= np.linalg.norm(weights) or 1.0
+        starts, ends = self.indptr[features], self.indptr[features + 1]
+        lengths = ends - starts
+        if not lengths.sum():
+            return np.zeros(n, dtype=np.float64)
+        # Flattened index ranges [start, end) of every query column
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+        return np.bincount(
+            self.indices[positions],
+            weights=self.data[positions] * np.repeat(weights, lengths),
+            minlength=n,
+        )
+
+    def rank(self, query, k=10, low=None, high=None, min_score=0.1):
+        """Top-k products most similar to the query, optionally within a price range"""
+        scores = self.scores(query)
+        if low is not None or high is not None:
+            scores = np.where(self.price_mask(low, high), scores, 0.0)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self.products[i] for i in top if scores[i] > min_score]
@@ -0,0 +1,81 @@
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from bot.cache import TTLCache, normalize_query
+
+PAGE_SIZE = 5
+# Follow-up words; a query is a follow-up only if every word is one of these
+# or filler, so "nike aur adidas mein farq" still goes through the search.
+MORE_WORDS = {"more", "next", "aur", "or", "mazeed", "baqi", "baki", "other", "another", "else"}
+CHEAPER_WORDS = {"sasta", "sasti", "saste", "sastay", "cheap", "cheaper", "cheapest", "kam"}
+PRICIER_WORDS = {"mehnga", "mehngi", "mehnge", "mehngay", "mahanga", "expensive", "costly"}
+FILLER_WORDS = {
+    "options", "option", "chahiye", "dikhao", "batao", "show", "me", "mujhe", "please", "koi", "kuch", "bhi",
+    "wala", "wali", "wale", "walay", "hai", "kya", "ya", "do", "de", "dein", "sa", "se", "thora", "thoda",
+    "zara", "price", "page", "shoes", "products", "product", "sneakers", "ones", "one", "the", "any", "some",
+    "give", "want", "i", "and", "than", "this", "that", "ke", "ki", "ka",
+}
+MAX_FOLLOW_UP_WORDS = 8
+
+# Ranked products behind the last product reply of a session, and how many were shown
+SessionResults = namedtuple("SessionResults", "query products price_range cursor")
+
+
+def parse_follow_up(text):
+    """"more", "cheaper" or "pricier" for short follow-ups ("aur options chahiye?", "sasta wala"), else None"""
+    words = normalize_query(text).split()
+    if not words or len(words) > MAX_FOLLOW_UP_WORDS:
+        return None
+    if any(w not in MORE_WORDS | CHEAPER_WORDS | PRICIER_WORDS | FILLER_WORDS for w in words):
+        return None
+    if CHEAPER_WORDS.intersection(words):
+        return "cheaper"
+    if PRICIER_WORDS.intersection(words):
+        return "pricier"
+    if MORE_WORDS.intersection(words):
+        return "more"
+    return None
+
+
+def price_key(product):
+    try:
+        return Decimal(product.price)
+    except (TypeError, ValueError, InvalidOperation):
+        return Decimal("Infinity")
+
+
+class SessionStore(TTLCache):
+    """Per Dialogflow session: the last ranked products, so follow-ups page or re-sort them"""
+
+    def remember(self, session, query, products, price_range=(None, None), shown=PAGE_SIZE):
+        """Replace the session's results with this ranked list (`shown` of them already listed)"""
+        if not products:
+            self.forget(session)
+        elif session:
+            products = tuple(products)
+            self.set(session, SessionResults(query, products, tuple(price_range), min(shown, len(products))))
+
+    def forget(self, session):
+        """Drop a session's results (its last reply was not a product list)"""
+        if session:
+            with self._lock:
+                self._data.pop(session, None)
+
+    def follow_up(self, session, kind, page_size=PAGE_SIZE):
+        """Next page of products for this follow-up kind; None if the session has no results.
+
+        An empty list means every result was shown already.
+        """
+        state = self.get(session) if session else None
+        if state is None:
+            return None
+        if kind == "more":
+            page = state.products[state.cursor:state.cursor + page_size]
+            state = state._replace(cursor=state.cursor + len(page))
+        else:
+            # Re-sort what we found; the cheapest (or priciest) come first
+            products = tuple(sorted(state.products, key=price_key, reverse=kind == "pricier"))
+            page = products[:page_size]
+            state = state._replace(products=products, cursor=len(page))
+        self.set(session, state)
+        return list(page)
@@ -1,3 +1,1023 @@
-from django.test import TestCase
+import asyncio
+import concurrent.futures
+import json
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+
+from bot import views
+from bot.cache import AnswerCache, TTLCache, normalize_query
+from bot.catalog import CatalogManager, CatalogSnapshot, bump_catalog_version, load_snapshot, save_snapshot
+from bot.columnar import ColumnarCatalog, load_catalog_file, write_catalog_file
+from bot.dbsearch import products_in_price_range, search_products
+from bot.management.commands.scrape_products import Command as ScrapeCommand
+from bot.facets import FacetIndex, title_facets
+from bot.intents import LocalAnswerEngine, NaiveBayesIntentModel
+from bot.knowledge import (
+    KnowledgeBase, PassageIndex, compact_pages, extract_site_facts, split_pages, write_knowledge,
+)
+from bot.llm import (
+    AdmissionGate, AdmissionRejected, CircuitBreaker, LLMPool, SingleFlight, close_async_http_client, close_http_client,
+    get_async_admission_gate,
+)
+from bot.metrics import METRICS, Histogram, begin_request, end_request
+from bot.models import Product
+from bot.pricing import parse_price_intent
+from bot.profiling import PROFILES
+from bot.prompts import PROMPT_PREFIX, build_prompt, truncate
+from bot.search import PriceIndex, ProductIndex, VectorRanker
+from bot.sessions import SessionStore, parse_follow_up
+from bot.warmup import WARMUP, should_warm_up, warm_up
+
+
+def make_product(title, price, handle=None):
+    handle = handle or title.lower().replace(" ", "-")
+    return Product(
+        title=title,
+        price=Decimal(price),
+        image_url="https://cdn.example.com/p.png",
+        product_link=f"https://royaltrend.pk/products/{handle}",
+    )
+
+
+class ProductIndexTests(TestCase):
+    def setUp(self):
+        self.index = ProductIndex([
+            make_product("Nike Air Max 90 (Black)", "12000"),
+            make_product("Adidas Terrex Free Hiker (Army Green)", "15000"),
+            make_product("Skechers Ultra Go Slip-On", "6500"),
+        ])
+
+    def test_exact_and_fuzzy_words(self):
+        self.assertEqual(self.index.search("nike")[0].title, "Nike Air Max 90 (Black)")
+        self.assertEqual(self.index.search("addidas terrex")[0].title, "Adidas Terrex Free Hiker (Army Green)")
+
+    def test_price_range_filter(self):
+        self.assertEqual(self.index.search("nike skechers", low=5000, high=7000)[0].title, "Skechers Ultra Go Slip-On")
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search("xyz"), [])
+
+
+class VectorRankerTests(TestCase):
+    def setUp(self):
+        self.ranker = VectorRanker([
+            make_product("Nike Air Max 90 (Black)", "12000"),
+            make_product("Nike Airmax 270 (White)", "9000"),
+            make_product("Skechers Slides (Black)", "4000"),
+        ])
+
+    def test_char_ngrams_rank_similar_titles(self):
+        titles = [p.title for p in self.ranker.rank("nike airmaxx", k=2)]
+        self.assertEqual(set(titles), {"Nike Air Max 90 (Black)", "Nike Airmax 270 (White)"})
+
+    def test_price_mask_applied_in_same_pass(self):
+        titles = [p.title for p in self.ranker.rank("nike black", k=3, low=5000, high=10000)]
+        self.assertEqual(titles, ["Nike Airmax 270 (White)"])
+        self.assertEqual(self.ranker.rank("zzzz"), [])
+
+
+class PriceIntentTests(TestCase):
+    def test_parses_bounds_suffixes_and_roman_urdu(self):
+        cases = {
+            "under 5k": (None, 5000),
+            "5000 se kam": (None, 5000),
+            "10-15 hazar": (10000, 15000),
+            "10k se zyada": (10000, None),
+            "Rs. 7,500 tak": (None, 7500),
+            "shoes 5000 15000": (5000, 15000),
+            "nike air max 90": (None, None),
+            "size 42-43": (None, None),
+            "nike air max 720": (None, None),
+            "air max 720 dikhao": (None, None),
+            "air max 2090": (None, None),
+            "air max 270 black": (None, None),
+            "air max 97 under 15k": (None, 15000),
+            "air max 270 max 12k": (None, 12000),
+            "max rs 9000": (None, 9000),
+        }
+        for text, expected in cases.items():
+            self.assertEqual(parse_price_intent(text), expected, text)
+
+    def test_price_index_ranges(self):
+        index = PriceIndex([make_product(f"Shoe {price}", str(price)) for price in (3000, 9000, 5000, 7000)])
+        self.assertEqual([p.title for p in index.between(4000, 8000)], ["Shoe 5000", "Shoe 7000"])
+        self.assertEqual([p.title for p in index.between(None, 8000, limit=2)], ["Shoe 7000", "Shoe 5000"])
+        self.assertEqual(index.between(10000, None), [])
+
+
+class FacetIndexTests(TestCase):
+    def setUp(self):
+        self.index = FacetIndex([
+            make_product("NK Airmax 90 (Black)", "12000"),
+            make_product("AF 1 Low (White)", "9000"),
+            make_product("AD Terrex free hiker 2.0 low gore-tex (Army Green)", "15000"),
+            make_product("Air Jordan 4 Bred Black/Red Sneakers", "14000"),
+        ])
+
+    def test_title_facets(self):
+        facets = title_facets("AD Terrex free hiker 2.0 low gore-tex (Army Green)")
+        self.assertEqual(facets["brand"], {"Adidas"})
+        self.assertEqual(facets["color"], {"green"})
+        self.assertTrue({"gore-tex", "low", "hiking"} <= facets["keyword"])
+        self.assertEqual(title_facets("Air Jordan 4 Bred Black/Red Sneakers")["brand"], {"Jordan"})
+
+    def test_match_intersects_facets(self):
+        self.assertEqual([p.title for p in self.index.match("black nike")], ["NK Airmax 90 (Black)"])
+        self.assertEqual([p.title for p in self.index.match("kala jordan")], ["Air Jordan 4 Bred Black/Red Sneakers"])
+        self.assertIsNone(self.index.match("delivery charges"))
+
+    def test_multi_word_brand_names(self):
+        index = FacetIndex(self.index.products + (
+            make_product("NB 550 White Green", "15000"), make_product("New Balance 9060 Grey", "18000"),
+        ))
+        self.assertEqual(title_facets("New Balance 9060 Grey")["brand"], {"New Balance"})
+        self.assertEqual(title_facets("New Balance 9060 Grey")["model"], {"9060"})
+        self.assertEqual({p.title for p in index.match("new balance 550 sizes")},
+                         {"NB 550 White Green", "New Balance 9060 Grey"})
+        self.assertIsNone(index.match("new shoes with good balance"))
+
+    def test_query_ignores_title_only_aliases_and_price_words(self):
+        index = FacetIndex(self.index.products + (make_product("Lo-Vi Trainers (Grey)", "5000"),))
+        self.assertIsNone(index.match("ye lo"))
+        self.assertEqual(index.query_facets("dekh lo jordan"), {"brand": {"Jordan"}})
+        self.assertIsNone(index.match("low price shoes"))
+        self.assertIsNone(index.match("high quality shoes"))
+        self.assertEqual(index.query_facets("nike low white"), {"brand": {"Nike"}, "color": {"white"}, "keyword": {"low"}})
+
+    def test_summary_only_mentions_query_brands(self):
+        self.assertTrue(self.index.summary("nike dikhao").startswith("Nike:"))
+        self.assertEqual(set(self.index.summary("hello").split(", ")), {"Nike", "Adidas", "Jordan"})
+
+
+class LLMPoolTests(TestCase):
+    def test_deadline_is_enforced_and_call_detached(self):
+        pool = LLMPool(max_workers=1)
+        release = threading.Event()
+        start = time.monotonic()
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            pool.run(release.wait, timeout=0.05)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(pool.stats()["detached"], 1)
+
+        # The busy worker makes the next call queue, and it is cancelled on timeout
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            pool.run(lambda: "late", timeout=0.05)
+        release.set()
+        stats = pool.stats()
+        self.assertEqual(stats["cancelled"], 1)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertEqual(pool.run(lambda: "ok", timeout=1), "ok")
+
+
+class SingleFlightTests(TestCase):
+    def test_concurrent_identical_calls_share_one_upstream_call(self):
+        flight = SingleFlight(LLMPool(max_workers=4))
+        release = threading.Event()
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            release.wait(2)
+            return "answer"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.run("k", upstream, timeout=2)))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        while flight.stats()["collapsed"] < 4:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ["answer"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats(), {"in_flight": 0, "leaders": 1, "collapsed": 4})
+
+    def test_shared_call_abandoned_by_last_waiter_only(self):
+        pool = LLMPool(max_workers=1)
+        flight = SingleFlight(pool)
+        release = threading.Event()
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            flight.run("k", release.wait, timeout=0.05)
+        self.assertEqual(pool.stats()["detached"], 1)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+        release.set()
+
+
+class AdmissionGateTests(TestCase):
+    def test_full_queue_and_missed_deadline_are_rejected(self):
+        gate = AdmissionGate(max_concurrency=1, max_queue=1)
+        gate.acquire(time.monotonic() + 1)
+        with self.assertRaises(AdmissionRejected):
+            gate.acquire(time.monotonic() + 0.05)  # waits in the queue, slot never frees
+        waiter = threading.Thread(target=lambda: self.assertRaises(
+            AdmissionRejected, gate.acquire, time.monotonic() + 0.3))
+        waiter.start()
+        while gate.stats()["waiting"] < 1:
+            time.sleep(0.005)
+        with self.assertRaises(AdmissionRejected):
+            gate.acquire(time.monotonic() + 1)  # queue full: rejected without waiting
+        waiter.join()
+        stats = gate.stats()
+        self.assertEqual((stats["rejected_full"], stats["rejected_deadline"]), (1, 2))
+        self.assertEqual(stats["waiting"], 0)
+
+    def test_waiters_admitted_earliest_deadline_first(self):
+        gate = AdmissionGate(max_concurrency=1, max_queue=2)
+        gate.acquire(time.monotonic() + 1)
+        order = []
+
+        def wait(name, budget):
+            gate.acquire(time.monotonic() + budget)
+            order.append(name)
+            gate.release()
+
+        late = threading.Thread(target=wait, args=("late", 2))
+        late.start()
+        while gate.stats()["waiting"] < 1:
+            time.sleep(0.005)
+        early = threading.Thread(target=wait, args=("early", 1))
+        early.start()
+        while gate.stats()["waiting"] < 2:
+            time.sleep(0.005)
+        gate.release()
+        late.join()
+        early.join()
+        self.assertEqual(order, ["early", "late"])
+        self.assertEqual(gate.stats()["admitted"], 3)
+        self.assertGreater(gate.stats()["wait_p95"], 0)
+
+    def test_estimated_wait_rejects_without_queueing(self):
+        gate = AdmissionGate(max_concurrency=1, max_queue=4)
+        gate.acquire(time.monotonic() + 1)
+        gate.release(service_time=2.0)  # calls take ~2 s
+        gate.acquire(time.monotonic() + 1)
+        start = time.monotonic()
+        with self.assertRaises(AdmissionRejected):
+            gate.acquire(time.monotonic() + 1)
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertEqual(gate.stats()["rejected_estimate"], 1)
+        gate.check(time.monotonic() + 5)  # fits: no exception
+
+    def test_busy_gate_degrades_before_timeout_and_queue_wait_is_timed(self):
+        found = [make_product("Nike Air Max 90", "9000")]
+        busy = AdmissionGate(max_concurrency=1, max_queue=4)
+        busy.acquire(time.monotonic() + 1)
+        busy.release(service_time=10.0)
+        busy.acquire(time.monotonic() + 1)
+        METRICS.reset()
+        with mock.patch.object(views, "get_admission_gate", return_value=busy), \
+                mock.patch.object(views, "get_breaker", return_value=CircuitBreaker()), \
+                mock.patch.object(views, "find_products", return_value=found), \
+                mock.patch.object(views, "query_gemini") as gemini:
+            start = time.monotonic()
+            answer = views.query_with_timeout("nike air max busy gate", "", [], "Nike", timeout=4)
+            self.assertLess(time.monotonic() - start, 1)
+            gemini.assert_not_called()
+            self.assertIn("Nike Air Max 90", answer)
+            self.assertEqual(METRICS.snapshot()["counters"], {"llm_fallback_admission": 1})
+
+            gemini.return_value = "Yeh rahe options"
+            begin_request()
+            free = AdmissionGate(max_concurrency=1, max_queue=1)
+            with mock.patch.object(views, "get_admission_gate", return_value=free):
+                self.assertEqual(views.query_with_timeout("nike air max free gate", "", [], "Nike"), "Yeh rahe options")
+            self.assertIn("llm_queue", end_request())
+
+    def test_async_gate_holds_many_pending_calls(self):
+        async def run():
+            gate = get_async_admission_gate()
+            self.assertIs(get_async_admission_gate(), gate)  # one per event loop
+
+            async def call():
+                await gate.acquire_async(time.monotonic() + 5)
+                await asyncio.sleep(0.01)
+                gate.release(service_time=0.01)
+
+            await asyncio.gather(*(call() for _ in range(1000)))
+            return gate.stats()
+
+        with override_settings(GEMINI_ASYNC_POOL_SIZE=50):
+            stats = asyncio.run(run())
+        self.assertEqual((stats["max_concurrency"], stats["admitted"]), (50, 1000))
+        self.assertEqual((stats["active"], stats["waiting"]), (0, 0))
+
+    def test_rejected_request_degrades_to_product_reply(self):
+        found = [make_product("Nike Air Max 90", "9000")]
+        gate = AdmissionGate(max_concurrency=0, max_queue=0)
+        with mock.patch.object(views, "get_admission_gate", return_value=gate), \
+                mock.patch.object(views, "get_breaker", return_value=CircuitBreaker()), \
+                mock.patch.object(views, "find_products", return_value=found), \
+                mock.patch.object(views, "query_gemini") as gemini:
+            answer = views.query_with_timeout("nike air max", "", [], "Nike", timeout=2)
+        gemini.assert_not_called()
+        self.assertIn("Nike Air Max 90", answer)
+
+
+class CircuitBreakerTests(TestCase):
+    def test_opens_on_errors_then_half_open_probe_closes(self):
+        breaker = CircuitBreaker(window=10, min_calls=4, error_threshold=0.5, cooldown=0.05)
+        for ok in (True, False, False, False):
+            breaker.record(ok, 0.2)
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())   # the single half-open probe
+        self.assertFalse(breaker.allow())  # everyone else still short-circuits
+        breaker.record(True, 0.2)
+        self.assertEqual(breaker.state, "closed")
+        self.assertEqual(breaker.stats()["short_circuited"], 2)
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(min_calls=1, cooldown=0.01)
+        breaker.record(False, 1.0)
+        time.sleep(0.02)
+        self.assertTrue(breaker.allow())
+        breaker.record(False, 1.0)
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(breaker.times_opened, 2)
+
+    def test_timeout_follows_latency_p95(self):
+        breaker = CircuitBreaker(min_timeout=0.5, timeout_factor=2)
+        self.assertEqual(breaker.timeout(4), 4)  # no data yet
+        for _ in range(20):
+            breaker.record(True, 0.6)
+        self.assertAlmostEqual(breaker.timeout(4), 1.2)
+        for _ in range(20):
+            breaker.record(True, 3.0)
+        self.assertEqual(breaker.timeout(4), 4)  # never above the caller's deadline
+
+    def test_open_breaker_serves_products_without_calling_gemini(self):
+        found = [make_product("Nike Air Max 90", "9000")]
+        breaker = CircuitBreaker()
+        breaker._open()
+        with mock.patch.object(views, "get_breaker", return_value=breaker), \
+                mock.patch.object(views, "find_products", return_value=found), \
+                mock.patch.object(views, "query_gemini") as gemini:
+            answer = views.query_with_timeout("nike air max", "", [], "Nike", timeout=4)
+        gemini.assert_not_called()
+        self.assertTrue(answer.startswith("Yeh options available hain:"))
+        self.assertIn("Nike Air Max 90", answer)
+
+
+class PromptBuilderTests(TestCase):
+    def test_sections_ranked_and_cut_to_budget(self):
+        products = [make_product(f"Adidas Samba {i}", "9000") for i in range(40)]
+        products.append(make_product("Nike Air Max 90 (Black)", "12000"))
+        website = "\n".join(["FREE DELIVERY IN ALL OVER PAKISTAN"] + [f"filler line {i}" for i in range(200)])
+        brands = ", ".join(f"Brand{i}" for i in range(300))
+        prompt, sizes = build_prompt("nike air max", website, products, brands, budget=1000)
+
+        self.assertTrue(prompt.startswith(PROMPT_PREFIX))
+        self.assertLessEqual(sizes["products"] + sizes["website"] + sizes["brands"], 1000)
+        self.assertEqual(sizes["total"], len(prompt))
+        products_section = prompt.split("Sample Products:\n")[1]
+        self.assertTrue(products_section.startswith("Nike Air Max 90 (Black) - Rs. 12000"))
+        self.assertIn("User asked: nike air max", prompt)
+
+    def test_unused_budget_moves_to_later_sections(self):
+        website = "\n".join(f"delivery line {i}" for i in range(100))
+        _, sizes = build_prompt("delivery", website, [], "Nike", budget=1000)
+        self.assertEqual(sizes["products"], 0)
+        self.assertGreater(sizes["website"], 350 + 100)  # own share plus the products' share
+
+    def test_truncate_on_separator(self):
+        self.assertEqual(truncate("Nike, Adidas, New Balance", 18), "Nike, Adidas")
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        METRICS.reset()
+
+    def test_histogram_percentiles(self):
+        hist = Histogram(window=100)
+        for ms in range(1, 101):
+            hist.observe(ms / 1000)
+        summary = hist.summary()
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual((summary["p50_ms"], summary["p95_ms"], summary["p99_ms"]), (51.0, 96.0, 100.0))
+
+    def test_webhook_stages_and_metrics_endpoint(self):
+        payload = {"queryResult": {"queryText": "5000 se kam shoes", "intent": {"displayName": "Default Fallback Intent"}}}
+        with mock.patch.object(views, "find_products", return_value=[make_product("Nike Air Max 90", "4500")]):
+            response = self.client.post("/webhook/", json.dumps(payload), content_type="application/json")
+        self.assertIn("Nike Air Max 90", response.json()["fulfillmentText"])
+
+        data = self.client.get("/metrics/").json()
+        for stage in ("json_decode", "catalog_load", "price_parse", "product_search", "response_encode", "total"):
+            self.assertEqual(data["stages"][stage]["count"], 1, stage)
+        self.assertEqual(data["counters"], {"reply_price": 1})
+        self.assertIn("hit_rate", data["answer_cache"])
+        self.assertIn("state", data["breaker"])
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0.0, PROFILING_SECRET="s3cret")
+class ProfilingTests(TestCase):
+    payload = json.dumps({"queryResult": {"queryText": "hello", "intent": {"displayName": "Default Fallback Intent"}}})
+
+    def post(self, **headers):
+        with mock.patch.object(views, "smart_query_handler", return_value="Hi!"):
+            return self.client.post("/webhook/", self.payload, content_type="application/json", **headers)
+
+    def test_secret_header_captures_profile_for_staff_download(self):
+        before = len(PROFILES.list())
+        self.post()
+        self.assertEqual(len(PROFILES.list()), before)  # no header, 0% sample rate
+        self.assertEqual(self.post(HTTP_X_PROFILE_SECRET="s3cret").json(), {"fulfillmentText": "Hi!"})
+        entry = PROFILES.list()[-1]
+        self.assertEqual((entry["path"], entry["reason"]), ("/webhook/", "header"))
+
+        url = f"/profiles/{entry['id']}/"
+        self.assertEqual(self.client.get(url).status_code, 302)  # not staff -> admin login
+        User.objects.create_user("admin", password="pw", is_staff=True)
+        self.client.login(username="admin", password="pw")
+        self.assertIn("dialogflow_webhook", self.client.get(url, {"format": "text"}).content.decode())
+        self.assertEqual(self.client.get(url)["Content-Type"], "application/octet-stream")
+        self.assertEqual(self.client.get("/profiles/999999/").status_code, 404)
+
+    def test_async_webhook_profiled(self):
+        async def post():
+            with mock.patch.object(views, "asmart_query_handler", return_value="Hi!"):
+                return await AsyncClient().post(
+                    "/webhook/async/", self.payload, content_type="application/json",
+                    headers={"X-Profile-Secret": "s3cret"},
+                )
+
+        views.get_catalog()
+        self.assertEqual(asyncio.run(post()).json(), {"fulfillmentText": "Hi!"})
+        entry = PROFILES.list()[-1]
+        self.assertEqual((entry["path"], entry["reason"]), ("/webhook/async/", "header"))
+        self.assertIn("dialogflow_webhook_async", PROFILES.get(entry["id"])["report"])
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled_never_profiles(self):
+        before = len(PROFILES.list())
+        self.post(HTTP_X_PROFILE_SECRET="s3cret")
+        self.assertEqual(len(PROFILES.list()), before)
+
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def do_POST(self):
+        StubGeminiHandler.connections.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["contents"][0]["parts"][0]["text"]
+        reply = {"candidates": [{"content": {"parts": [{"text": f" stub:{len(prompt)} "}]}}]}
+        data = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubGeminiServer(ThreadingHTTPServer):
+    request_queue_size = 128  # bursts of concurrent async connections
+    daemon_threads = True
+
+
+class GeminiClientTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StubGeminiServer(("127.0.0.1", 0), StubGeminiHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        close_http_client()
+        super().tearDownClass()
+
+    def test_query_gemini_reuses_connection(self):
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        StubGeminiHandler.connections.clear()
+        close_http_client()
+        with override_settings(GEMINI_API_BASE=base, GEMINI_API_KEY="test"):
+            for _ in range(3):
+                answer = views.query_gemini("nike", "", [], "Nike", timeout=2)
+                self.assertTrue(answer.startswith("stub:"))
+        self.assertEqual(len(StubGeminiHandler.connections), 1)
+        close_http_client()
+
+    def test_async_webhook_keeps_json_contract(self):
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        payload = json.dumps({"queryResult": {"queryText": "async wala sawal", "intent": {"displayName": "LLMQueryIntent"}}})
+
+        async def run():
+            try:
+                ok = await AsyncClient().post("/webhook/async/", payload, content_type="application/json")
+                bad = await AsyncClient().post("/webhook/async/", "{not json", content_type="application/json")
+                # Many pending upstream calls on one event loop, no thread per call
+                answers = await asyncio.gather(*(views.aquery_gemini(f"q{i}", "", [], "Nike", timeout=5) for i in range(100)))
+                return ok, bad, answers
+            finally:
+                await close_async_http_client()
+
+        with override_settings(GEMINI_API_BASE=base, GEMINI_API_KEY="test"), \
+                mock.patch.object(views, "answer_locally", return_value=None), \
+                mock.patch.object(views, "get_breaker", return_value=CircuitBreaker()), \
+                mock.patch.object(views, "get_admission_gate", return_value=AdmissionGate(4, 4)):
+            ok, bad, answers = asyncio.run(run())
+        self.assertTrue(ok.json()["fulfillmentText"].startswith("stub:"))
+        self.assertEqual((bad.status_code, bad.json()), (400, {"fulfillmentText": "⚠️ Invalid request body."}))
+        self.assertTrue(all(answer.startswith("stub:") for answer in answers))
+
+    def test_async_timeout_falls_back_to_products(self):
+        async def slow_gemini(*args, **kwargs):
+            await asyncio.sleep(1)
+
+        found = [make_product("Nike Air Max 90", "9000")]
+        views.get_catalog()  # loaded outside the event loop, as warm-up does
+        with override_settings(GEMINI_API_KEY="test"), \
+                mock.patch.object(views, "agemini_generate", slow_gemini), \
+                mock.patch.object(views, "find_products", return_value=found), \
+                mock.patch.object(views, "get_breaker", return_value=CircuitBreaker()), \
+                mock.patch.object(views, "get_admission_gate", return_value=AdmissionGate(4, 4)):
+            answer = asyncio.run(views.aquery_with_timeout("dheere wala sawal", "", [], "Nike", timeout=0.05))
+        self.assertEqual(answer, "Yeh options available hain:\nNike Air Max 90 – Rs. 9000")
+
+    def test_async_identical_queries_share_one_call(self):
+        calls = []
+
+        async def gemini(*args, **kwargs):
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            body = {"candidates": [{"content": {"parts": [{"text": "Yeh rahe options"}]}}]}
+            return mock.Mock(status_code=200, json=lambda: body)
+
+        async def run():
+            answers = await asyncio.gather(*(
+                views.aquery_with_timeout("ek jaisa sawal", "", [], "Nike", timeout=2) for _ in range(5)
+            ))
+            return answers, views.get_async_single_flight().stats()
+
+        views.get_catalog()
+        with override_settings(GEMINI_API_KEY="test"), \
+                mock.patch.object(views, "agemini_generate", gemini), \
+                mock.patch.object(views, "get_breaker", return_value=CircuitBreaker()):
+            answers, stats = asyncio.run(run())
+        self.assertEqual(answers, ["Yeh rahe options"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(stats, {"in_flight": 0, "leaders": 1, "collapsed": 4})
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_replays_corpus_against_stub_gemini(self):
+        make_product("Nike Air Max 90 (Black)", "4500").save()
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "bench.json"
+            call_command("benchmark_webhook", rounds=2, concurrency=2, latency=0, output=str(output), stdout=StringIO())
+            report = json.loads(output.read_text())
+        self.assertEqual(set(report["paths"]), {"english", "roman_urdu", "price", "llm_intent"})
+        self.assertEqual(report["overall"]["requests"], 2 * report["corpus_size"])
+        self.assertEqual(report["overall"]["errors"], 0)
+        self.assertIn("p99_ms", report["paths"]["price"])
+        self.assertEqual(report["answer_cache"]["hits"], 0)  # cleared before each round
+        # Per-path throughput is over that path's own time, not the whole run
+        price = report["paths"]["price"]
+        self.assertGreater(price["throughput_rps"], price["requests"] / report["elapsed_s"])
+
+
+class AnswerCacheTests(TestCase):
+    def test_normalize_query_unifies_variants(self):
+        self.assertEqual(normalize_query("Price kia he?"), normalize_query("price  KYA hai"))
+
+    def test_key_includes_catalog_version(self):
+        cache = AnswerCache()
+        products = [make_product("Nike Air Max", "12000")]
+        cache.set(cache.make_key("price kya hai", products, "1"), "Rs. 12000")
+        self.assertEqual(cache.get(cache.make_key("Price kia he", products, "1")), "Rs. 12000")
+        self.assertIsNone(cache.get(cache.make_key("price kya hai", products, "2")))
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_lru_and_ttl(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        for k in "abc":
+            cache.set(k, k)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), "c")
+        expired = TTLCache(maxsize=2, ttl=-1)
+        expired.set("a", "a")
+        self.assertIsNone(expired.get("a"))
+
+
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        views.SESSION_STORE.clear()
+        self.products = [make_product(f"Nike Model {i}", str(20000 - i * 1000)) for i in range(12)]
+
+    def test_parse_follow_up(self):
+        self.assertEqual(parse_follow_up("Aur options chahiye?"), "more")
+        self.assertEqual(parse_follow_up("show me more"), "more")
+        self.assertEqual(parse_follow_up("sasta wala"), "cheaper")
+        self.assertEqual(parse_follow_up("koi mehnga sa dikhao"), "pricier")
+        self.assertIsNone(parse_follow_up("nike aur adidas mein kya farq hai"))
+        self.assertIsNone(parse_follow_up("5000 se kam"))
+
+    def test_pages_and_resorts(self):
+        store = SessionStore(maxsize=2, ttl=60)
+        store.remember("s1", "nike", self.products)
+        self.assertEqual([p.title for p in store.follow_up("s1", "more")], [f"Nike Model {i}" for i in range(5, 10)])
+        self.assertEqual(len(store.follow_up("s1", "more")), 2)
+        self.assertEqual(store.follow_up("s1", "more"), [])
+        self.assertEqual(store.follow_up("s1", "cheaper")[0].title, "Nike Model 11")
+        self.assertEqual(store.follow_up("s1", "more")[0].title, "Nike Model 6")  # continues in price order
+        self.assertIsNone(store.follow_up("other", "more"))
+        store.remember("s2", "a", self.products)
+        store.remember("s3", "b", self.products)
+        self.assertIsNone(store.follow_up("s1", "more"))  # least recently used session evicted
+
+    def post(self, session, query):
+        payload = {
+            "session": f"projects/royaltrend/agent/sessions/{session}",
+            "queryResult": {"queryText": query, "intent": {"displayName": "Default Fallback Intent"}},
+        }
+        return self.client.post("/webhook/", json.dumps(payload), content_type="application/json").json()
+
+    def test_webhook_follow_up_skips_search(self):
+        post = self.post
+        with mock.patch.object(views, "find_products", return_value=self.products) as find:
+            first = post("a", "nike under 25k")
+            self.assertIn("Nike Model 4", first["fulfillmentText"])
+            more = post("a", "aur options chahiye?")
+            self.assertIn("Nike Model 5", more["fulfillmentText"])
+            self.assertNotIn("Nike Model 4", more["fulfillmentText"])
+            cheaper = post("a", "sasta wala")
+            self.assertTrue(cheaper["fulfillmentText"].split("\n")[1].startswith("Nike Model 11"))
+            self.assertEqual(find.call_count, 1)
+        self.assertEqual(views.SESSION_STORE.stats()["size"], 1)
+
+    def test_llm_reply_counts_no_products_as_shown(self):
+        with mock.patch.object(views, "find_products", return_value=self.products), \
+                mock.patch.object(views, "query_with_timeout", return_value="Gift ke liye Nike Model 3 best hai"):
+            self.post("a", "gift ke liye kaunse best rahenge")
+        more = self.post("a", "aur options chahiye?")["fulfillmentText"]
+        self.assertIn("Nike Model 0", more)  # Gemini chose what to mention, the list starts at the top
+        self.assertNotIn("Nike Model 5", more)
+
+    def test_local_replies_replace_session_results(self):
+        other = [make_product(f"Nike Black {i}", "9000") for i in range(4)]
+        with mock.patch.object(views, "find_products", return_value=self.products):
+            self.post("a", "nike under 25k")
+        with mock.patch.object(views, "find_products", return_value=other):
+            self.assertIn("Nike Black 2", self.post("a", "mujhe black nike chahiye, dikhao")["fulfillmentText"])
+            more = self.post("a", "aur options chahiye?")["fulfillmentText"]
+        self.assertIn("Nike Black 3", more)  # continues after the 3 products the local reply listed
+        self.assertNotIn("Nike Model", more)
+
+        self.post("a", "delivery charges kya hain?")  # no product list: results dropped
+        self.assertIsNone(views.SESSION_STORE.follow_up("projects/royaltrend/agent/sessions/a", "more"))
+
+
+class DatabaseSearchTests(TestCase):
+    def setUp(self):
+        for title, price in [("Nike Air Max 90 (Black)", "12000"), ("Nike Dunk Low", "9000"),
+                             ("Adidas Samba OG", "8500"), ("Hoka Clifton 9", "15000")]:
+            make_product(title, price).save()
+
+    def titles(self, products):
+        return [p.title for p in products]
+
+    def test_fts_search_with_price_filter(self):
+        self.assertEqual(set(self.titles(search_products("nike shoes"))), {"Nike Air Max 90 (Black)", "Nike Dunk Low"})
+        self.assertEqual(self.titles(search_products("nike", high=10000)), ["Nike Dunk Low"])
+        self.assertEqual(self.titles(search_products("clif")), ["Hoka Clifton 9"])  # prefix match
+        self.assertEqual(self.titles(search_products("naik dunk"))[0], "Nike Dunk Low")  # brand alias
+        self.assertEqual(search_products("?!"), [])
+
+    def test_fts_follows_scraper_writes(self):
+        product = Product.objects.get(title="Adidas Samba OG")
+        product.title = "Adidas Gazelle"
+        Product.objects.bulk_update([product], ["title"])
+        self.assertEqual(search_products("og"), [])
+        self.assertEqual(self.titles(search_products("gazelle")), ["Adidas Gazelle"])
+        Product.objects.filter(title__startswith="Hoka").delete()
+        self.assertEqual(search_products("hoka"), [])
+
+    def test_price_range_order_and_unique_link(self):
+        self.assertEqual(self.titles(products_in_price_range(8000, 12000, limit=2)), ["Adidas Samba OG", "Nike Dunk Low"])
+        self.assertEqual(self.titles(products_in_price_range(None, 10000, limit=2)), ["Nike Dunk Low", "Adidas Samba OG"])
+        with self.assertRaises(IntegrityError):
+            make_product("Nike Dunk Low", "9500").save()
+
+    def test_filler_only_query_same_in_memory_and_db(self):
+        make_product("Loafer Formal Shoes (Black)", "7000").save()
+        snapshot = CatalogSnapshot.load("v1")
+        with mock.patch.object(views, "get_catalog", return_value=snapshot):
+            for query in ["shoes kya hai?", "koi shoes hain ke", "nike shoes ka price kya hai"]:
+                memory = self.titles(views.find_products(query))
+                with override_settings(PRODUCT_SEARCH_MODE="db"):
+                    db = self.titles(views.find_products(query))
+                self.assertEqual(set(memory), set(db), query)
+        self.assertEqual(set(memory), {"Nike Air Max 90 (Black)", "Nike Dunk Low"})
+        self.assertEqual(search_products("shoes kya hai?"), [])
+
+    @override_settings(PRODUCT_SEARCH_MODE="db")
+    def test_db_mode_snapshot_and_find_products(self):
+        snapshot = CatalogSnapshot.load("v1")
+        self.assertEqual(snapshot.products, ())
+        self.assertIn("Nike", snapshot.brands)
+        with mock.patch.object(views, "get_catalog", return_value=snapshot):
+            self.assertEqual(self.titles(views.find_products("adidas samba")), ["Adidas Samba OG"])
+            self.assertIn("Nike Dunk Low", views.smart_query_handler("nike 10000 se kam"))
+
+
+class ColumnarCatalogTests(TestCase):
+    rows = [
+        (7, "Nike Air Max 90 (Black)", Decimal("12000.00"), "https://cdn.example.com/a.png", "https://royaltrend.pk/products/a"),
+        (9, "Sketch Max Cushion Slides\u202f–\u202fKhaki", Decimal("4999.50"), "", "https://royaltrend.pk/products/b"),
+    ]
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = write_catalog_file(self.rows, "v1", Path(tmp) / "catalog.bin")
+            catalog = ColumnarCatalog(path)
+            self.assertEqual(len(catalog), 2)
+            self.assertEqual(
+                [(p.pk, p.title, p.price, p.image_url, p.product_link) for p in catalog], self.rows
+            )
+            self.assertEqual(f"Rs. {catalog[1].price}", "Rs. 4999.50")
+            self.assertEqual([p.title for p in catalog[-1:]], [self.rows[1][1]])
+            self.assertEqual(catalog.prices.tolist(), [1200000, 499950])
+            self.assertIsNone(load_catalog_file("v2", path))  # written for another version
+            self.assertEqual(len(ColumnarCatalog(write_catalog_file([], "v3", Path(tmp) / "empty.bin"))), 0)
+
+    def test_paths_are_absolute(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(CATALOG_FILE="catalog.bin"):
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                write_catalog_file(self.rows, "v1")
+                catalog = load_catalog_file("v1")
+            finally:
+                os.chdir(cwd)
+            # Pickled snapshots re-map this path from whatever directory the worker runs in
+            self.assertEqual(catalog.__reduce__()[1], (os.path.join(os.path.realpath(tmp), "catalog.bin"), "v1"))
+
+    def test_snapshot_uses_file_for_current_version(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(CATALOG_FILE=Path(tmp) / "catalog.bin"):
+            write_catalog_file(self.rows, "v1")
+            snapshot = CatalogSnapshot.load("v1")
+            self.assertEqual([p.title for p in snapshot.search_index.search("nike air max")], [self.rows[0][1]])
+            self.assertEqual(snapshot.price_index.between(None, 5000)[0].pk, 9)
+            self.assertEqual(CatalogSnapshot.load("v2").products, ())  # other version -> empty test DB
+
+
+class CatalogReloadTests(TransactionTestCase):
+    def test_snapshot_swapped_after_version_bump(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                override_settings(CATALOG_VERSION_FILE=Path(tmp) / "catalog_version.txt"):
+            manager = CatalogManager(check_interval=0)
+            empty = manager.get()
+            self.assertEqual(empty.products, ())
+            self.assertIs(manager.get(), empty)  # empty catalog is still a cache hit
+
+            make_product("Nike Air Max 90 (Black)", "12000").save()
+            version = bump_catalog_version()
+            self.assertIs(manager.get(), empty)  # old snapshot served while rebuilding
+            deadline = time.monotonic() + 5
+            while manager.snapshot.version != version and time.monotonic() < deadline:
+                time.sleep(0.01)
+            snapshot = manager.get()
+            self.assertEqual(snapshot.version, version)
+            self.assertEqual(snapshot.brands, ("Nike",))
+            self.assertEqual(snapshot.search_index.search("nike")[0].title, "Nike Air Max 90 (Black)")
+
+
+class WarmStartTests(TestCase):
+    rows = ColumnarCatalogTests.rows
+
+    def setUp(self):
+        saved = dict(WARMUP)
+        self.addCleanup(WARMUP.update, saved)
+
+    def test_snapshot_artifact_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(CATALOG_FILE=Path(tmp) / "catalog.bin"):
+            write_catalog_file(self.rows, "v1")
+            path = save_snapshot(CatalogSnapshot.load("v1"), Path(tmp) / "snapshot.pkl")
+            snapshot = load_snapshot("v1", path)
+            self.assertEqual(snapshot.version, "v1")
+            self.assertEqual([p.title for p in snapshot.search_index.search("nike air max")], [self.rows[0][1]])
+            self.assertIsNone(load_snapshot("v2", path))  # scraped again since
+            write_catalog_file(self.rows[:1], "v2")
+            self.assertIsNone(load_snapshot("v1", path))  # columnar rows behind it were replaced
+
+    def test_should_warm_up(self):
+        server = {"CATALOG_WARMUP_SERVER": "1"}  # set by wsgi.py / asgi.py
+        self.assertTrue(should_warm_up(["/venv/bin/gunicorn", "chatbot.wsgi"], server))
+        self.assertTrue(should_warm_up(["manage.py", "runserver"], {"RUN_MAIN": "true"}))
+        self.assertTrue(should_warm_up(["manage.py", "runserver", "--noreload"], {}))
+        self.assertFalse(should_warm_up(["manage.py", "runserver"], {}))  # autoreloader parent
+        self.assertFalse(should_warm_up(["manage.py", "scrape_products"], {}))
+        self.assertFalse(should_warm_up(["/usr/lib/python3/site-packages/django/__main__.py", "migrate"], {}))
+        self.assertFalse(should_warm_up(["/venv/bin/django-admin", "shell"], {}))
+        with override_settings(CATALOG_WARMUP=False):
+            self.assertFalse(should_warm_up(["/venv/bin/gunicorn", "chatbot.wsgi"], server))
+
+    def test_readiness_endpoint(self):
+        WARMUP.update(state="running")
+        self.assertEqual(self.client.get("/ready/").status_code, 503)
+        with mock.patch("bot.warmup.connection"):  # keep the test transaction's connection
+            warm_up()
+        response = self.client.get("/ready/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["state"], "ready")
+        self.assertIsNotNone(response.json()["seconds"])
+
+
+def shopify_product(handle, title, price):
+    return {"handle": handle, "title": title, "variants": [{"price": price}], "images": [{"src": "https://cdn.example.com/p.png"}]}
+
+
+class FakeSession:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get(self, url, timeout=None):
+        page = int(url.rsplit("=", 1)[1])
+        return mock.Mock(status_code=200, json=lambda: {"products": self.pages.get(page, [])})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class IncrementalScrapeTests(TestCase):
+    def test_only_changes_are_written(self):
+        make_product("Nike A", "1000.00", "a").save()
+        make_product("Nike B", "2000.00", "b").save()
+        make_product("Nike C", "3000.00", "c").save()
+        pages = {
+            1: [shopify_product("a", "Nike A", "1000.00"), shopify_product("b", "Nike B", "2500.00")],
+            2: [shopify_product("d", "Nike D", "4000")],
+        }
+        command = ScrapeCommand(stdout=StringIO())
+        with mock.patch("bot.management.commands.scrape_products.requests.Session", lambda: FakeSession(pages)):
+            rows, changed = command.scrape_products_incremental(workers=3)
+
+        self.assertTrue(changed)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(
+            sorted(Product.objects.values_list("title", "price")),
+            [("Nike A", Decimal("1000.00")), ("Nike B", Decimal("2500.00")), ("Nike D", Decimal("4000.00"))],
+        )
+        self.assertIn("1 added, 1 updated, 1 removed", command.stdout.getvalue())
+        self.assertEqual(set(command.timings), {"fetch", "diff", "write"})
+
+
+class StaticPagesScrapeTests(TestCase):
+    def test_conditional_requests_skip_unchanged_pages(self):
+        requests_seen = []
+
+        class PagesSession(FakeSession):
+            def get(self, url, headers=None, timeout=None):
+                requests_seen.append(headers or {})
+                if headers and headers.get("If-None-Match") == '"v1"':
+                    return mock.Mock(status_code=304)
+                return mock.Mock(
+                    status_code=200, headers={"ETag": '"v1"'},
+                    content=b"<p>Free delivery</p>", text="<p>Free delivery</p>",
+                )
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch("bot.management.commands.scrape_products.requests.Session", lambda: PagesSession({})), \
+                override_settings(KNOWLEDGE_FILE=f"{tmp}/k.txt", KNOWLEDGE_INDEX_FILE=f"{tmp}/k.json",
+                                  PAGES_CONTENT_FILE=f"{tmp}/pages.txt", PAGES_STATE_FILE=f"{tmp}/state.json"):
+            command = ScrapeCommand(stdout=StringIO())
+            self.assertTrue(command.scrape_static_pages(workers=2))
+            self.assertIn("Free delivery", Path(f"{tmp}/pages.txt").read_text(encoding="utf-8"))
+            self.assertFalse(command.scrape_static_pages(workers=2))
+        self.assertTrue(all(h.get("If-None-Match") == '"v1"' for h in requests_seen[7:]))
+
+
+class KnowledgeCompactionTests(TestCase):
+    RAW = "\n".join(
+        f"==== https://royaltrend.pk/{name} ====\nSkip to content\n"
+        + "Flash Sale: FREE DELIVERY\n" * 5
+        + "Choosing a selection results in a full page refresh.\nCustomer Service +92 315 1179953\n"
+        + f"{body}\nRoyal Trend\nNike Air Max\nRs. 9,000\nRs. 12,000\nUnit price\n/\nper\n"
+        for name, body in [("about", "We sell shoes"), ("contact", "Call 0315"), ("sale", "Big sale")]
+    )
+
+    def test_boilerplate_stripped_site_facts_kept_once(self):
+        sections = {(page, name): text for page, name, text in compact_pages(split_pages(self.RAW))}
+        self.assertEqual(sections[("site", "facts")], "Flash Sale: FREE DELIVERY\nCustomer Service +92 315 1179953")
+        self.assertEqual(sections[("https://royaltrend.pk/contact", "content")], "Call 0315")
+        self.assertNotIn("full page refresh", "\n".join(sections.values()))
+        self.assertNotIn("Nike Air Max", "\n".join(sections.values()))  # "trending" widget on every page
+
+    def test_sale_headline_from_real_pages_skips_countdown(self):
+        with open(settings.BASE_DIR / "pages_content.txt", encoding="utf-8") as f:
+            facts = extract_site_facts(compact_pages(split_pages(f.read())))
+        self.assertEqual(facts["sale"][0], "Flash Sale: Up to 30% Off! - FREE DELIVERY IN ALL OVER PAKISTAN")
+        self.assertFalse(any("End ins" in line for line in facts["sale"]))
+
+    def test_sections_read_back_by_offset(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            write_knowledge(compact_pages(split_pages(self.RAW)), f"{tmp}/k.txt", f"{tmp}/k.json")
+            knowledge = KnowledgeBase(f"{tmp}/k.txt", f"{tmp}/k.json")
+            self.assertEqual(knowledge.section("https://royaltrend.pk/about", "content"), "We sell shoes")
+            self.assertTrue(knowledge.text(limit=10).startswith("Flash Sale"))
+            knowledge._mm.close()
+
+
+class PassageIndexTests(TestCase):
+    SECTIONS = [
+        ("site", "facts", "Flash Sale: Up to 30% Off\nCustomer Service +92 315 1179953"),
+        ("about", "content", "Royal Trend sells quality footwear for every occasion"),
+        ("delivery", "content", "Fast & Reliable Delivery Across Pakistan\nDelivery charges are free"),
+    ]
+
+    def test_top_passage_for_query(self):
+        index = PassageIndex(self.SECTIONS)
+        self.assertIn("Delivery charges", index.context("dilivery charjes kya hai"))
+        self.assertNotIn("footwear", index.context("dilivery charjes kya hai"))
+
+    def test_budget_and_fallback(self):
+        index = PassageIndex(self.SECTIONS)
+        self.assertEqual(index.context("delivery", budget=10), "")
+        self.assertTrue(index.context("zzz").startswith("Flash Sale"))
+
+
+class LocalAnswerEngineTests(TestCase):
+    def setUp(self):
+        self.catalog = mock.Mock(facts={
+            "phone": "+92 315 1179953", "email": "info@royaltrend.pk",
+            "delivery": ["FREE DELIVERY IN ALL OVER PAKISTAN"], "sale": [], "sale_products": [],
+        })
+        self.products = [make_product("Nike Air Max 90 (Black)", "12000")]
+
+    def answer(self, engine, query):
+        return engine.answer(query, self.catalog, lambda q: self.products if "nike" in q.lower() else [])
+
+    def test_common_intents_answered_without_llm(self):
+        engine = LocalAnswerEngine()
+        self.assertIn("FREE DELIVERY", self.answer(engine, "delivery charges kya hain?"))
+        self.assertIn("+92 315 1179953", self.answer(engine, "contact number kia he"))
+        self.assertIn("Nike Air Max 90", self.answer(engine, "nike shoes dikhao, kya options hain"))
+        self.assertIsNone(self.answer(engine, "mere pao mein dard hai"))
+        self.assertIsNone(self.answer(engine, "adidas dikhao"))  # no products found -> LLM
+        self.assertEqual(engine.stats()["answered_locally"], 3)
+        self.assertEqual(engine.stats()["bypass_rate"], 0.6)
+
+    def test_ambiguous_words_fall_through_to_llm(self):
+        engine = LocalAnswerEngine()
+        self.catalog.facts["sale"] = ["Flash Sale: Up to 30% Off!"]
+        self.assertIsNone(self.answer(engine, "off white jordan"))
+        self.assertIsNone(self.answer(engine, "meri order kab tak ayegi"))  # one weak phrase
+        self.assertIsNone(self.answer(engine, "size 42 number available hai kya"))
+        self.assertIsNone(self.answer(engine, "call karo ghar pe"))
+        self.assertIn("Flash Sale", self.answer(engine, "sale ya discount hai kya"))
+
+    def test_single_hits_and_complaints_fall_through_to_llm(self):
+        engine = LocalAnswerEngine()
+        self.assertIsNone(self.answer(engine, "meri delivery abhi tak nahi aayi, order 12345"))
+        self.assertIsNone(self.answer(engine, "is COD available in Karachi"))
+        self.assertIsNone(self.answer(engine, "nike air max ka price kya hai"))
+        self.assertIsNone(self.answer(engine, "delivery charges kya hain? order cancel karna hai"))
+        self.assertEqual(engine.stats()["answered_locally"], 0)
+
+    def test_trained_model_is_a_second_signal(self):
+        model = NaiveBayesIntentModel.train([
+            ("nike ki price kya hai", "price"), ("jordan kitne ka hai", "price"),
+            ("delivery kab tak hogi", "delivery"), ("mera order nahi aaya", "delivery"),
+            ("return policy kya hai", "other"), ("exchange ho sakta hai", "other"),
+        ])
+        engine = LocalAnswerEngine(model)
+        self.assertIn("Nike Air Max 90", self.answer(engine, "nike ki price kya hai"))
+        self.assertIsNone(self.answer(engine, "meri delivery abhi tak nahi aayi, order 12345"))
+
+    def test_trained_model_blends_with_lexicon(self):
+        model = NaiveBayesIntentModel.train([
+            ("parcel kab milay ga", "delivery"), ("order kab aye ga", "delivery"),
+            ("return policy kya hai", "other"), ("exchange ho sakta hai", "other"),
+        ])
+        engine = LocalAnswerEngine(model)
+        intent, confidence = engine.classify("parcel kab aye ga")
+        self.assertEqual(intent, "delivery")
+        self.assertGreater(confidence, 0.6)
@@ -1,14 +1,30 @@
-import os
+import asyncio
 import json
 import re
-import requests
-import difflib
 import concurrent.futures
-from django.http import JsonResponse
+import functools
+import logging
+import time
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from bot.models import Product
+from asgiref.sync import sync_to_async
+from bot.llm import (
+    ASYNC_ADMISSION_GATES, ASYNC_SINGLE_FLIGHTS, AdmissionRejected, agemini_generate, gemini_generate,
+    get_admission_gate, get_async_admission_gate, get_async_single_flight, get_breaker, get_llm_pool,
+    get_single_flight,
+)
+from bot.metrics import METRICS, begin_request, end_request, log_event, timed
+from bot.cache import AnswerCache
+from bot.catalog import get_catalog
+from bot.dbsearch import products_in_price_range, product_search_mode, sample_products, search_products
+from bot.pricing import parse_price_intent
+from bot.profiling import PROFILES, profiled
+from bot.sessions import PAGE_SIZE, SessionStore, parse_follow_up
+from bot.prompts import PROMPT_SIZES, build_prompt
+from bot.intents import PRODUCTS_SHOWN, get_intent_engine
+from bot.warmup import WARMUP, is_ready
 from django.conf import settings
-import traceback
 # import google.generativeai as genai
 
 # # Configure Gemini API
@@ -24,127 +40,108 @@ import traceback
 
 
 # --- Caching Setup ---
-PAGES_CACHE = None
-BRANDS_CACHE = None
-PRODUCTS_CACHE = None
+ANSWER_CACHE = AnswerCache(
+    maxsize=getattr(settings, "ANSWER_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "ANSWER_CACHE_TTL", 600),
+)
+# Last ranked products per Dialogflow session, for "aur options" / "sasta wala" follow-ups
+SESSION_STORE = SessionStore(
+    maxsize=getattr(settings, "SESSION_CACHE_SIZE", 2048),
+    ttl=getattr(settings, "SESSION_CACHE_TTL", 900),
+)
 
 
-def get_pages_content():
-    """Load pages_content.txt only once (fast performance)"""
-    global PAGES_CACHE
-    if PAGES_CACHE:
-        return PAGES_CACHE
-    if os.path.exists("pages_content.txt"):
-        with open("pages_content.txt", "r", encoding="utf-8") as f:
-            PAGES_CACHE = f.read()[:2000]  # limit to 2000 chars for speed
-    return PAGES_CACHE or ""
+def get_pages_content(user_query=""):
+    """Website passages relevant to the query from the current catalog snapshot"""
+    return get_catalog().pages_content(user_query)
 
 
 def get_brands():
-    """Extract brand names from products only once"""
-    global BRANDS_CACHE
-    if BRANDS_CACHE:
-        return BRANDS_CACHE
-    BRANDS_CACHE = list(set([p.title.split()[0] for p in Product.objects.all()]))
-    return BRANDS_CACHE
+    """Brand names from the current catalog snapshot"""
+    return list(get_catalog().brands)
+
+
+def get_brand_context(user_query=""):
+    """Only the brands/models the query is about (all brand names if it names none)"""
+    return get_catalog().facets.summary(user_query)
 
 
 def get_all_products():
-    """Cache all products in memory for fast filtering"""
-    global PRODUCTS_CACHE
-    if PRODUCTS_CACHE:
-        return PRODUCTS_CACHE
-    PRODUCTS_CACHE = list(Product.objects.all())
-    return PRODUCTS_CACHE
-
-
-# def detect_language(user_query):
-#     """Detect simple language: Roman Urdu vs English"""
-#     urdu_words = ["mujhe", "kaun", "kon", "kaha", "dikhao", "dikho",
-#                   "range", "mahanga", "sasta", "pao", "dard", "kis", "kaisa"]
-#     return "urdu" if any(word in user_query.lower() for word in urdu_words) else "english"
-
-def detect_language(text):
-    import re
-    if re.search(r"[\u0600-\u06FF]", text):
-        return "urdu"
-    return "english"
+    """All products from the current catalog snapshot"""
+    return get_catalog().products
+
+
+def get_search_index():
+    """Product title search index from the current catalog snapshot"""
+    return get_catalog().search_index
+
 
 def parse_price_range(user_query):
-    """Extract numeric price range if mentioned"""
-    numbers = re.findall(r'\d+', user_query)
-    if len(numbers) >= 2:
-        low, high = int(numbers[0]), int(numbers[1])
-        return low, high
-    return None, None
+    """Extract price range if mentioned ("under 5k", "5000 se kam", "10-15 hazar", ...)"""
+    return parse_price_intent(user_query)
 
 
 def find_products(user_query):
     """Find relevant products based on query and price filters"""
-    all_products = get_all_products()
-    results = []
     low, high = parse_price_range(user_query)
+    if product_search_mode() == "db":
+        # 🗄️ FTS5 + price index in the database, no catalog in this process
+        return search_products(user_query, limit=10, low=low, high=high)
+    # One snapshot for both lookups: the id() intersection must not span a hot swap
+    catalog = get_catalog()
+    facet_matches = catalog.facets.match(user_query)
+    if facet_matches is None:
+        return catalog.search_index.search(user_query, limit=10, low=low, high=high)
+
+    # "black Nike": facet intersection decides the set, the text index the order
+    allowed = {id(p) for p in facet_matches}
+    ranked = [
+        p for p in catalog.search_index.search(user_query, limit=50, low=low, high=high)
+        if id(p) in allowed
+    ]
+    if len(ranked) < 10:
+        seen = {id(p) for p in ranked}
+        ranked += [
+            p for p in facet_matches
+            if id(p) not in seen and in_price_range(p, low, high)
+        ][:10 - len(ranked)]
+    return ranked[:10]
+
+
+def in_price_range(product, low, high):
+    try:
+        price = float(product.price)
+    except (TypeError, ValueError):
+        return True
+    return (low is None or price >= low) and (high is None or price <= high)
+
+
+def products_in_range(low, high, limit=5):
+    """Products priced in [low, high] (price index in memory or in the database)"""
+    if product_search_mode() == "db":
+        return products_in_price_range(low, high, limit=limit)
+    return get_catalog().price_index.between(low, high, limit=limit)
 
-    for p in all_products:
-        title_lower = p.title.lower()
 
-        # Price filtering
-        price_match = True
-        if low and high:
-            try:
-                price_val = float(p.price)
-                if not (low <= price_val <= high):
-                    price_match = False
-            except:
-                pass
+def first_products(limit):
+    """Prompt padding when the search finds nothing"""
+    if product_search_mode() == "db":
+        return sample_products(limit)
+    return get_all_products()[:limit]
 
-        # Relevance matching
-        relevance = difflib.SequenceMatcher(None, user_query.lower(), title_lower).ratio()
-        if relevance > 0.3 and price_match:
-            results.append((relevance, p))
 
-    results = sorted(results, key=lambda x: x[0], reverse=True)[:10]  # top 10 products
-    return [p for _, p in results]
+def rank_similar_products(user_query, limit=10):
+    """Fuzzy "similar shoes" ranking over all titles (NumPy n-gram cosine)"""
+    low, high = parse_price_range(user_query)
+    return get_catalog().ranker.rank(user_query, k=limit, low=low, high=high)
 
 
-def query_gemini(user_query, website_content, products, brands):
+def query_gemini(user_query, website_content, products, brands, timeout=30):
     """Ask Gemini to answer user query based on cached website data"""
     try:
-        #product_text = "\n".join([f"{p.title} - Rs. {p.price}" for p in products])
-        product_text = "\n".join([f"{p.title} - Rs. {getattr(p, 'price', 'N/A')}" for p in products])
-        
-        # Detect language
-        language = detect_language(user_query)
-
-        prompt = f"""
-        You are a friendly **sales agent** for Royal Trend.
-
-        📝 RULES:
-        - Always reply in same language as user query.
-        - Always reply in same language as user query(English and Roman Urdu).
-        - If language is "urdu", reply in Roman Urdu (English alphabets only).
-        - If language is "English", reply in English.
-        - Keep replies short (3-6 lines), friendly & casual like WhatsApp chat.
-        - No long paragraphs or formal tone., not like a long email.
-        - Do NOT always start with "Assalamu Alaikum", use it rarely or skip.
-        - If user asks for products, show max 2-3 best suggestions only.
-        - End with a small question or call-to-action: e.g. "Aapko size bataun?" or "Aur options chahiye?"
-        - If price range is given, suggest only products from that range.
-        - If user mentions foot pain, suggest comfortable/orthopedic shoes.
-        - No long paragraphs, just short helpful sentences.
-        - **Reply to the user as fast as possible, ideally within 3 seconds.**
-
-        Website Content:
-        {website_content}
-
-        Available Brands:
-        {brands}
-
-        Sample Products:
-        {product_text}
-
-        User asked: {user_query}
-        """
+        # Precomputed rules + sections ranked and cut to the prompt budget
+        with timed("prompt_build"):
+            prompt, _ = build_prompt(user_query, website_content, products, brands)
 
         # model = genai.GenerativeModel("gemini-1.5-flash")
         # response = model.generate_content(prompt)
@@ -154,53 +151,288 @@ def query_gemini(user_query, website_content, products, brands):
         if not GEMINI_API_KEY:
             return "⚠️ Gemini API key not configured."
 
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-lite:generateContent?key={GEMINI_API_KEY}"
-        headers = {"Content-Type": "application/json"}
-        payload = {"contents": [{"parts": [{"text": prompt}]}]}
-
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        if response.status_code == 200:
-            data = response.json()
-            return data["candidates"][0]["content"]["parts"][0]["text"].strip()
-        else:
-            return f"⚠️ Gemini error: {response.status_code}"
+        response = gemini_generate(prompt, GEMINI_API_KEY, deadline=timeout)
+        return gemini_reply_text(response)
 
         
     except Exception as e:
         return f"⚠️ Error while generating response: {str(e)}"
 
 
-def query_with_timeout(user_query, website_content, products, brands, timeout=4):
-    """Run Gemini query but fallback if slow"""
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future = executor.submit(query_gemini, user_query, website_content, products, brands)
-        try:
-            return future.result(timeout=timeout)
-        except concurrent.futures.TimeoutError:
-            return "⏳ Server busy hai, mai aapko best products recommend kar raha hoon..."
+def gemini_reply_text(response):
+    """Answer text of a generateContent response, or the error message"""
+    if response.status_code == 200:
+        data = response.json()
+        return data["candidates"][0]["content"]["parts"][0]["text"].strip()
+    else:
+        return f"⚠️ Gemini error: {response.status_code}"
 
 
-def smart_query_handler(user_query):
-    """Main handler that decides how to respond"""
-    website_content = get_pages_content()
-    brands_list = ", ".join(get_brands())
+def is_cacheable_answer(answer):
+    """Only real Gemini replies are cached, never error/timeout messages"""
+    return bool(answer) and len(answer.strip()) >= 5 and not answer.startswith(("⚠️", "⏳"))
+
+
+def product_answer(products, heading="Yeh options available hain:"):
+    """Short formatted product list, used when Gemini is skipped"""
+    product_texts = [f"{p.title} – Rs. {p.price}" for p in products]
+    return heading + "\n" + "\n".join(product_texts)
+
+
+def fallback_answer(user_query, products, reason):
+    """Deterministic reply from the products we already found (Gemini slow or down)"""
+    METRICS.incr(f"llm_fallback_{reason}")
+    products = find_products(user_query)[:5] or list(products)[:5]
+    if products:
+        return product_answer(products)
+    return "⏳ Server busy hai, mai aapko best products recommend kar raha hoon..."
+
+
+def min_call_budget():
+    """Seconds an upstream call needs at least; queueing past (deadline - this) is pointless"""
+    return getattr(settings, "GEMINI_MIN_TIMEOUT", 1.0)
+
+
+def query_and_cache(cache_key, user_query, website_content, products, brands, timeout=30, deadline=None):
+    """query_gemini that stores good answers (even if the caller already gave up waiting)"""
+    if deadline is None:
+        deadline = time.monotonic() + timeout
+    # 🚦 Wait for an upstream slot only while enough of the budget is left for the call itself
+    gate = get_admission_gate()
+    with timed("llm_queue"):
+        gate.acquire(deadline - min_call_budget())
+    start = time.monotonic()
+    try:
+        # Time spent queued comes out of the call's own budget
+        budget = max(min(timeout, deadline - start), 0.1)
+        answer = query_gemini(user_query, website_content, products, brands, timeout=budget)
+        get_breaker().record(is_cacheable_answer(answer), time.monotonic() - start)
+    finally:
+        gate.release(time.monotonic() - start)
+    if is_cacheable_answer(answer):
+        ANSWER_CACHE.set(cache_key, answer)
+    return answer
+
+
+def query_with_timeout(user_query, website_content, products, brands, timeout=4):
+    """Run Gemini query on the shared LLM pool but fallback if slow"""
+    products = list(products)
+    cache_key = ANSWER_CACHE.make_key(
+        user_query, products, get_catalog().version, parse_price_range(user_query)
+    )
+    cached = ANSWER_CACHE.get(cache_key)
+    if cached:
+        return cached
+
+    breaker = get_breaker()
+    if not breaker.allow():
+        # 🔌 Circuit open: answer from our own catalog instead of waiting on Gemini
+        return fallback_answer(user_query, products, "breaker")
+    timeout = breaker.timeout(timeout)
+    deadline = time.monotonic() + timeout
+
+    # HTTP timeout = deadline, so an abandoned call frees its worker soon after
+    call = functools.partial(
+        query_and_cache, cache_key, user_query, website_content, products, brands,
+        timeout=timeout, deadline=deadline,
+    )
+    try:
+        if not get_single_flight().in_flight(cache_key):
+            # No slot in time by the gate's own estimate: degrade now, not after the full timeout
+            get_admission_gate().check(deadline - min_call_budget())
+        # Identical concurrent queries wait on one upstream call
+        with timed("llm_wait"):
+            return get_single_flight().run(cache_key, call, timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        return fallback_answer(user_query, products, "timeout")
+    except AdmissionRejected:
+        # No free upstream slot in time: answer from our own catalog
+        return fallback_answer(user_query, products, "admission")
+
+
+def answer_locally(user_query, session=None):
+    """Templated reply for common intents (delivery, contact, sale, price, products), or None.
+
+    Resets the session's results: to the products a reply listed, otherwise to none
+    (the caller remembers what it answers with instead).
+    """
+    shown = []
+
+    def find(query):
+        shown[:] = find_products(query)
+        return shown
+
+    answer = get_intent_engine().answer(user_query, get_catalog(), find)
+    if answer and shown:
+        SESSION_STORE.remember(session, user_query, shown, parse_price_range(user_query), shown=PRODUCTS_SHOWN)
+    else:
+        SESSION_STORE.forget(session)
+    return answer
+
+
+def follow_up_answer(session, user_query):
+    """Next page / re-sorted page of the session's last results for "aur options", "sasta wala"; else None"""
+    kind = parse_follow_up(user_query)
+    if kind is None:
+        return None
+    products = SESSION_STORE.follow_up(session, kind)
+    if products is None:
+        return None  # nothing remembered for this session, answer it like any other query
+    METRICS.incr("reply_session")
+    if not products:
+        return "Is search ke saare options dikha diye hain 🙂 Koi aur brand, color ya budget batayein?"
+    heading = {"more": "Yeh aur options hain:", "cheaper": "Sab se saste options:", "pricier": "Premium options:"}[kind]
+    return product_answer(products, heading)
+
+
+def route_query(user_query, session=None):
+    """Answer without Gemini when we can: (answer, None), otherwise (None, query_with_timeout kwargs)"""
+    # 🔁 "aur options" / "sasta wala": page through what this session was just shown
+    answer = follow_up_answer(session, user_query)
+    if answer:
+        return answer, None
 
     # 🔎 First check if price range mentioned
-    low, high = parse_price_range(user_query)
-    if low and high:
-        products = Product.objects.filter(price__gte=low, price__lte=high)[:5]
+    with timed("price_parse"):
+        low, high = parse_price_range(user_query)
+    if low is not None or high is not None:
+        # Products matching the words of the query first, otherwise anything in range
+        with timed("product_search"):
+            products = find_products(user_query) or products_in_range(low, high, limit=PAGE_SIZE * 4)
         if products:
+            SESSION_STORE.remember(session, user_query, products, (low, high))
             # ✅ Directly return short formatted text (fast)
-            product_texts = [f"{p.title} – Rs. {p.price}" for p in products]
-            return "Yeh options available hain:\n" + "\n".join(product_texts)
+            METRICS.incr("reply_price")
+            return product_answer(products[:PAGE_SIZE]), None
 
-    # 🔎 Otherwise use fuzzy product finder
-    products = find_products(user_query)
-    if not products:  
-        products = Product.objects.all()[:20]  # fallback
+    # ⚡ Common questions answered locally, without waiting on Gemini
+    local_answer = answer_locally(user_query, session)
+    if local_answer:
+        METRICS.incr("reply_local")
+        return local_answer, None
 
+    # 🔎 Otherwise use fuzzy product finder
+    with timed("product_search"):
+        products = find_products(user_query)
+        if not products:
+            products = rank_similar_products(user_query)
+        if not products:
+            products = first_products(20)  # fallback
+    # Gemini picks what to mention from these, so none count as listed yet: "aur options"
+    # then starts with the top products instead of skipping a page the customer never saw
+    SESSION_STORE.remember(session, user_query, products, (low, high), shown=0)
+
+    METRICS.incr("reply_llm")
+    return None, {
+        "website_content": get_pages_content(user_query),
+        "products": products,
+        "brands": get_brand_context(user_query),
+        "timeout": 4,
+    }
+
+
+def llm_intent_args(user_query):
+    """query_with_timeout kwargs for LLMQueryIntent"""
+    return {
+        "website_content": get_pages_content(user_query),
+        "products": first_products(50),
+        "brands": get_brand_context(user_query),
+        "timeout": 4,
+    }
+
+
+def smart_query_handler(user_query, session=None):
+    """Main handler that decides how to respond"""
+    answer, llm_args = route_query(user_query, session)
+    if answer is not None:
+        return answer
     # 🔎 Ask Gemini but with timeout
-    return query_with_timeout(user_query, website_content, products, brands_list, timeout=4)
+    return query_with_timeout(user_query, **llm_args)
+
+
+# --- Async path (served through chatbot/asgi.py) ---
+
+async def catalog_call(fn, *args):
+    """Run a catalog lookup inline, or in a thread when it queries the database (db search mode)"""
+    if product_search_mode() == "db":
+        return await sync_to_async(fn)(*args)
+    return fn(*args)
+
+
+async def aquery_gemini(user_query, website_content, products, brands, timeout=30):
+    """query_gemini() awaiting the HTTP call on the event loop instead of a worker thread"""
+    try:
+        with timed("prompt_build"):
+            prompt, _ = build_prompt(user_query, website_content, products, brands)
+        GEMINI_API_KEY = getattr(settings, "GEMINI_API_KEY", None)
+        if not GEMINI_API_KEY:
+            return "⚠️ Gemini API key not configured."
+        response = await agemini_generate(prompt, GEMINI_API_KEY, deadline=timeout)
+        return gemini_reply_text(response)
+    except Exception as e:
+        return f"⚠️ Error while generating response: {str(e)}"
+
+
+async def aquery_and_cache(cache_key, user_query, website_content, products, brands, timeout=30, deadline=None):
+    """query_and_cache() for the event loop"""
+    if deadline is None:
+        deadline = time.monotonic() + timeout
+    # This loop's own gate: sized for pending sockets, not for the thread pool
+    gate = get_async_admission_gate()
+    with timed("llm_queue"):
+        await gate.acquire_async(deadline - min_call_budget())
+    start = time.monotonic()
+    try:
+        budget = max(min(timeout, deadline - start), 0.1)
+        answer = await aquery_gemini(user_query, website_content, products, brands, timeout=budget)
+        get_breaker().record(is_cacheable_answer(answer), time.monotonic() - start)
+    finally:
+        gate.release(time.monotonic() - start)
+    if is_cacheable_answer(answer):
+        ANSWER_CACHE.set(cache_key, answer)
+    return answer
+
+
+async def aquery_with_timeout(user_query, website_content, products, brands, timeout=4):
+    """query_with_timeout() with an asyncio deadline; same cache, single-flight, breaker and fallbacks"""
+    products = list(products)
+    cache_key = ANSWER_CACHE.make_key(
+        user_query, products, get_catalog().version, parse_price_range(user_query)
+    )
+    cached = ANSWER_CACHE.get(cache_key)
+    if cached:
+        return cached
+
+    breaker = get_breaker()
+    if not breaker.allow():
+        return await catalog_call(fallback_answer, user_query, products, "breaker")
+    timeout = breaker.timeout(timeout)
+    deadline = time.monotonic() + timeout
+
+    flight = get_async_single_flight()
+    try:
+        if not flight.in_flight(cache_key):
+            # No slot in time by the gate's own estimate: degrade now, not after the full timeout
+            get_async_admission_gate().check(deadline - min_call_budget())
+        # Identical concurrent queries await one Gemini call
+        task = flight.task(cache_key, lambda: aquery_and_cache(
+            cache_key, user_query, website_content, products, brands, timeout=timeout, deadline=deadline,
+        ))
+        with timed("llm_wait"):
+            # shield(): a call we stop waiting for still finishes and fills the cache
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+    except asyncio.TimeoutError:
+        return await catalog_call(fallback_answer, user_query, products, "timeout")
+    except AdmissionRejected:
+        return await catalog_call(fallback_answer, user_query, products, "admission")
+
+
+async def asmart_query_handler(user_query, session=None):
+    """smart_query_handler() for the async webhook"""
+    answer, llm_args = await catalog_call(route_query, user_query, session)
+    if answer is not None:
+        return answer
+    return await aquery_with_timeout(user_query, **llm_args)
 
 # @csrf_exempt
 # def dialogflow_webhook(request):
@@ -253,63 +485,166 @@ def smart_query_handler(user_query):
 #     # ✅ If method not POST
 #     return JsonResponse({"error": "Invalid request method"}, status=405)
 
-import traceback   # add this at the top for detailed error logs
 
 @csrf_exempt
+@profiled
 def dialogflow_webhook(request):
     if request.method == "POST":
+        begin_request()
         try:
-            body = json.loads(request.body.decode("utf-8"))
-            print("📩 Raw Request Body:", body)  # log raw request
+            with timed("json_decode"):
+                body = json.loads(request.body.decode("utf-8"))
         except Exception as e:
-            print("❌ Error decoding request body:", str(e))
-            traceback.print_exc()
+            log_event(logging.WARNING, "bad_request_body", error=str(e), stages=end_request())
             return JsonResponse({"fulfillmentText": "⚠️ Invalid request body."}, status=400)
 
         user_query = body.get("queryResult", {}).get("queryText", "")
         intent = body.get("queryResult", {}).get("intent", {}).get("displayName", "")
+        session = body.get("session", "")
+        log_event(logging.DEBUG, "webhook_request", intent=intent, query=user_query)
 
-        print(f"📝 Extracted User Query: {user_query}")
-        print(f"🎯 Detected Intent: {intent}")
+        with timed("catalog_load"):
+            get_catalog()
 
         answer = "Sorry, I couldn't generate a reply."
 
         try:
             if intent == "LLMQueryIntent":
-                print(f"🚀 Handling LLMQueryIntent for: {user_query}")
-                answer = query_with_timeout(
-                    user_query,
-                    website_content=get_pages_content(),
-                    products=Product.objects.all()[:50],
-                    brands=", ".join(get_brands()),
-                    timeout=4
+                answer = (
+                    follow_up_answer(session, user_query)
+                    or answer_locally(user_query, session)
+                    or query_with_timeout(user_query, **llm_intent_args(user_query))
                 )
-                print("✅ Gemini Answer:", answer)
 
                 if not answer or "⏳" in answer:
-                    print("⚠️ Gemini Timeout or Empty Response")
+                    METRICS.incr("reply_busy")
+                    log_event(logging.WARNING, "llm_timeout", intent=intent, query=user_query, stages=end_request())
                     return JsonResponse({
                         "fulfillmentText": "⏳ Thoda waqt lag raha hai, lekin mai aapko best shoes suggest karta hoon..."
                     })
 
                 if not answer or len(answer.strip()) < 5:
-                    print("⚠️ Gemini returned short/empty response")
+                    METRICS.incr("reply_short")
                     answer = "Maaf kijiye! Aapke liye sahi jawab nahi mila, lekin mai aapko kuch best shoes suggest kar sakta hoon 👉 https://royaltrend.pk"
 
             else:
-                print(f"🤖 Default Fallback Handling for query: {user_query}")
-                answer = smart_query_handler(user_query)
-                print("✅ Smart Handler Answer:", answer)
+                answer = smart_query_handler(user_query, session)
 
         except Exception as e:
-            print("❌ Exception while processing intent:", str(e))
-            traceback.print_exc()
+            METRICS.incr("reply_error")
+            log_event(logging.ERROR, "webhook_error", exc_info=True, intent=intent, query=user_query, error=str(e))
             answer = "⚠️ Kuch problem hui, lekin aap hamari website https://royaltrend.pk par check kar sakte ho."
 
-        # ✅ Final log before sending response
-        print(f"📤 Final Reply to User: {answer}")
-        return JsonResponse({"fulfillmentText": answer})
+        with timed("response_encode"):
+            response = JsonResponse({"fulfillmentText": answer})
+        log_event(logging.INFO, "webhook_reply", intent=intent, query=user_query, answer_chars=len(answer),
+                  stages=end_request())
+        return response
 
     # Invalid method log
-    print("⚠️ Invalid HTTP Method:", request.method)
+    log_event(logging.WARNING, "invalid_method", method=request.method)
     return JsonResponse({"error": "Invalid request method"}, status=405)
+
+
+@csrf_exempt
+@profiled
+async def dialogflow_webhook_async(request):
+    """dialogflow_webhook for ASGI: same JSON contract, Gemini awaited without holding a thread"""
+    if request.method != "POST":
+        log_event(logging.WARNING, "invalid_method", method=request.method)
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+
+    begin_request()
+    try:
+        with timed("json_decode"):
+            body = json.loads(request.body.decode("utf-8"))
+    except Exception as e:
+        log_event(logging.WARNING, "bad_request_body", error=str(e), stages=end_request())
+        return JsonResponse({"fulfillmentText": "⚠️ Invalid request body."}, status=400)
+
+    user_query = body.get("queryResult", {}).get("queryText", "")
+    intent = body.get("queryResult", {}).get("intent", {}).get("displayName", "")
+    session = body.get("session", "")
+    log_event(logging.DEBUG, "webhook_request", intent=intent, query=user_query)
+
+    # A cold worker builds the snapshot from the ORM, which must not run on the event loop;
+    # after that every catalog lookup is in memory and runs inline
+    with timed("catalog_load"):
+        await sync_to_async(get_catalog)()
+
+    answer = "Sorry, I couldn't generate a reply."
+
+    try:
+        if intent == "LLMQueryIntent":
+            answer = (
+                follow_up_answer(session, user_query)
+                or await catalog_call(answer_locally, user_query, session)
+                or await aquery_with_timeout(user_query, **await catalog_call(llm_intent_args, user_query))
+            )
+
+            if not answer or "⏳" in answer:
+                METRICS.incr("reply_busy")
+                log_event(logging.WARNING, "llm_timeout", intent=intent, query=user_query, stages=end_request())
+                return JsonResponse({
+                    "fulfillmentText": "⏳ Thoda waqt lag raha hai, lekin mai aapko best shoes suggest karta hoon..."
+                })
+
+            if not answer or len(answer.strip()) < 5:
+                METRICS.incr("reply_short")
+                answer = "Maaf kijiye! Aapke liye sahi jawab nahi mila, lekin mai aapko kuch best shoes suggest kar sakta hoon 👉 https://royaltrend.pk"
+
+        else:
+            answer = await asmart_query_handler(user_query, session)
+
+    except Exception as e:
+        METRICS.incr("reply_error")
+        log_event(logging.ERROR, "webhook_error", exc_info=True, intent=intent, query=user_query, error=str(e))
+        answer = "⚠️ Kuch problem hui, lekin aap hamari website https://royaltrend.pk par check kar sakte ho."
+
+    with timed("response_encode"):
+        response = JsonResponse({"fulfillmentText": answer})
+    log_event(logging.INFO, "webhook_reply", intent=intent, query=user_query, answer_chars=len(answer),
+              stages=end_request())
+    return response
+
+
+def readiness(request):
+    """200 once the catalog warmup finished, 503 before (for load balancer health checks)"""
+    status = 200 if is_ready() else 503
+    return JsonResponse({"ready": status == 200, **WARMUP}, status=status)
+
+
+def metrics(request):
+    """Stage latency percentiles, cache hit rates and LLM fallback counts (JSON)"""
+    return JsonResponse({
+        **METRICS.snapshot(),
+        "answer_cache": ANSWER_CACHE.stats(),
+        "sessions": SESSION_STORE.stats(),
+        "local_intents": get_intent_engine().stats(),
+        "llm_pool": get_llm_pool().stats(),
+        "single_flight": get_single_flight().stats(),
+        "async_single_flight": [flight.stats() for flight in list(ASYNC_SINGLE_FLIGHTS.values())],
+        "admission": get_admission_gate().stats(),
+        "async_admission": [gate.stats() for gate in list(ASYNC_ADMISSION_GATES.values())],
+        "breaker": get_breaker().stats(),
+        "prompt_sizes": PROMPT_SIZES.stats(),
+    }, json_dumps_params={"ensure_ascii": False})
+
+
+@staff_member_required
+def profiles(request):
+    """Captured webhook profiles (newest last); admin only"""
+    return JsonResponse({"profiles": PROFILES.list()})
+
+
+@staff_member_required
+def profile_download(request, profile_id):
+    """One profile as a pstats file (?format=text for the cumulative-time report); admin only"""
+    entry = PROFILES.get(profile_id)
+    if entry is None:
+        raise Http404("Profile not found")
+    if request.GET.get("format") == "text":
+        return HttpResponse(entry["report"], content_type="text/plain; charset=utf-8")
+    response = HttpResponse(entry["data"], content_type="application/octet-stream")
+    response["Content-Disposition"] = f'attachment; filename="webhook-{profile_id}.prof"'
+    return response
@@ -0,0 +1,65 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from bot.metrics import log_event
+
+# Warmup progress, reported by the readiness endpoint
+WARMUP = {"state": "not_started", "seconds": None, "catalog_version": None, "error": None}
+_WARMUP_LOCK = threading.Lock()
+
+
+def should_warm_up(argv=None, environ=None):
+    """Warm up only in server processes: wsgi.py/asgi.py opt in, runserver is recognised by its argv"""
+    if not getattr(settings, "CATALOG_WARMUP", True):
+        return False
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    if environ.get("CATALOG_WARMUP_SERVER") == "1":
+        return True
+    if argv[1:2] == ["runserver"]:
+        # With the autoreloader only the child (RUN_MAIN) serves requests
+        return environ.get("RUN_MAIN") == "true" or "--noreload" in argv
+    return False
+
+
+def warm_up():
+    """Load the catalog snapshot (prebuilt artifact if present) and the other per-process state"""
+    from bot.catalog import CATALOG
+    from bot.intents import get_intent_engine
+    from bot.llm import get_http_client
+
+    start = time.perf_counter()
+    WARMUP["state"] = "running"
+    try:
+        snapshot = CATALOG.get()
+        get_intent_engine()
+        get_http_client()
+    except Exception as e:
+        WARMUP.update(state="failed", error=str(e), seconds=round(time.perf_counter() - start, 3))
+        log_event(logging.ERROR, "warmup_failed", exc_info=True, error=str(e))
+        return
+    finally:
+        connection.close()
+    WARMUP.update(state="ready", seconds=round(time.perf_counter() - start, 3), catalog_version=snapshot.version)
+    log_event(logging.INFO, "warmup_done", sampled=False, seconds=WARMUP["seconds"],
+              catalog_version=snapshot.version, products=len(snapshot.products))
+
+
+def start_warmup():
+    """Run warm_up() once per process in a background thread (requests meanwhile wait on the catalog lock)"""
+    with _WARMUP_LOCK:
+        if WARMUP["state"] != "not_started":
+            return
+        WARMUP["state"] = "starting"
+    threading.Thread(target=warm_up, name="catalog-warmup", daemon=True).start()
+
+
+def is_ready():
+    """Ready once warmup finished, or straight away when this process does not warm up"""
+    return WARMUP["state"] in ("ready", "not_started")
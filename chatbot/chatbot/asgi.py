@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatbot.settings')
+# Server process: load the catalog snapshot in BotConfig.ready(), before the first request
+os.environ.setdefault('CATALOG_WARMUP_SERVER', '1')
+# Serve /webhook/ with the async view: Gemini calls are awaited on the event loop
+os.environ.setdefault('ASYNC_WEBHOOK', '1')
 
 application = get_asgi_application()
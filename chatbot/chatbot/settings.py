@@ -10,17 +10,94 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent
+
 load_dotenv()
 
 # ab env se API key load karo
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-from pathlib import Path
-
-# Build paths inside the project like this: BASE_DIR / 'subdir'.
-BASE_DIR = Path(__file__).resolve().parent.parent
+# Gemini calls ke liye shared worker pool ka size
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "8"))
+# Ek waqt mein max itni Gemini calls, baaki chhoti queue mein (concurrency + queue <= workers rakhein)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "4"))
+
+# Gemini HTTP client (keep-alive pool); base URL ko local stand-in server pe point kar sakte hain
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
+GEMINI_HTTP_POOL_SIZE = int(os.getenv("GEMINI_HTTP_POOL_SIZE", "10"))
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "1.0"))
+
+# Async webhook (asgi.py isko on karta hai); async client ke connections thread pool se zyada ho sakte hain
+ASYNC_WEBHOOK = os.getenv("ASYNC_WEBHOOK", "0") == "1"
+GEMINI_ASYNC_POOL_SIZE = int(os.getenv("GEMINI_ASYNC_POOL_SIZE", "100"))
+# Async path ki apni limit: GEMINI_ASYNC_POOL_SIZE calls ek saath, itni queue mein
+LLM_ASYNC_MAX_QUEUE = int(os.getenv("LLM_ASYNC_MAX_QUEUE", "2000"))
+
+# Circuit breaker: itni error rate pe Gemini band, cooldown ke baad ek probe call
+GEMINI_BREAKER_ERROR_RATE = float(os.getenv("GEMINI_BREAKER_ERROR_RATE", "0.5"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+GEMINI_MIN_TIMEOUT = float(os.getenv("GEMINI_MIN_TIMEOUT", "1.0"))
+
+# Gemini answers ka LRU+TTL cache
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "600"))
+
+# Har Dialogflow session ke last products (LRU+TTL), "aur options" / "sasta wala" follow-ups ke liye
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "2048"))
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "900"))
+
+# Product search: "memory" (har worker mein catalog indexes) ya "db" (SQLite FTS5 + price index)
+PRODUCT_SEARCH_MODE = os.getenv("PRODUCT_SEARCH_MODE", "memory")
+
+# Scraper ki likhi compact catalog file (workers isko mmap karte hain); version marker ki tarah BASE_DIR mein
+CATALOG_FILE = os.getenv("CATALOG_FILE", str(BASE_DIR / "catalog.bin"))
+# Indexes samait prebuilt snapshot; worker start hote hi isko load karta hai (CATALOG_WARMUP=0 se band)
+CATALOG_SNAPSHOT_FILE = os.getenv("CATALOG_SNAPSHOT_FILE", str(BASE_DIR / "catalog_snapshot.pkl"))
+CATALOG_WARMUP = os.getenv("CATALOG_WARMUP", "1") == "1"
+
+# Catalog version marker kitni dair baad check karna hai (seconds)
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "5"))
+
+# Scraper ke static pages ka raw text, aur har page ka ETag/hash (agle run mein sirf badle pages)
+PAGES_CONTENT_FILE = os.getenv("PAGES_CONTENT_FILE", str(BASE_DIR / "pages_content.txt"))
+PAGES_STATE_FILE = os.getenv("PAGES_STATE_FILE", str(BASE_DIR / "pages_state.json"))
+
+# Scraper ka compact knowledge base (blob + byte offsets index), BASE_DIR mein
+KNOWLEDGE_FILE = os.getenv("KNOWLEDGE_FILE", str(BASE_DIR / "knowledge.txt"))
+KNOWLEDGE_INDEX_FILE = os.getenv("KNOWLEDGE_INDEX_FILE", str(BASE_DIR / "knowledge_index.json"))
+
+# Prompt mein website content: top-k BM25 passages, max itne characters
+KNOWLEDGE_PROMPT_BUDGET = int(os.getenv("KNOWLEDGE_PROMPT_BUDGET", "1200"))
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "5"))
+
+# Poore Gemini prompt ke dynamic sections (products, website, brands) ka character budget
+PROMPT_BUDGET = int(os.getenv("PROMPT_BUDGET", "3000"))
+PROMPT_MAX_PRODUCTS = int(os.getenv("PROMPT_MAX_PRODUCTS", "10"))
+
+# Local intent engine: is confidence se kam ho to Gemini se poochna hai
+LOCAL_INTENT_MIN_CONFIDENCE = float(os.getenv("LOCAL_INTENT_MIN_CONFIDENCE", "0.6"))
+# train_intents ka model file, BASE_DIR mein (server kahin se bhi start ho)
+INTENT_MODEL_FILE = os.getenv("INTENT_MODEL_FILE", str(BASE_DIR / "intent_model.json"))
+
+# Logging: JSON lines; INFO/DEBUG events ka sirf itna hissa likhna hai (warnings/errors hamesha)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+# `manage.py test` mein bot ke logs console pe nahi aate (LOG_IN_TESTS=1 se wapas)
+TESTING = sys.argv[1:2] == ["test"]
+LOG_HANDLER = "null" if TESTING and os.getenv("LOG_IN_TESTS", "0") != "1" else "console"
+
+# Webhook profiling (default band): sample rate se ya X-Profile-Secret header se, aakhri N profiles yaad rakhne hain
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.01"))
+PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")
+PROFILING_KEEP = int(os.getenv("PROFILING_KEEP", "20"))
 
 
 # Quick-start development settings - unsuitable for production
@@ -132,3 +209,15 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+        "null": {"class": "logging.NullHandler"},
+    },
+    "loggers": {
+        "bot": {"handlers": [LOG_HANDLER], "level": LOG_LEVEL, "propagate": False},
+    },
+}
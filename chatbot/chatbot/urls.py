@@ -36,8 +36,11 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path
+from django.conf import settings
 from django.http import HttpResponse
-from bot.views import dialogflow_webhook
+from bot.views import (
+    dialogflow_webhook, dialogflow_webhook_async, metrics, profile_download, profiles, readiness,
+)
 
 def home(request):
     return HttpResponse("✅ Server Running! Chatbot is Ready.")
@@ -45,7 +48,14 @@ def home(request):
 urlpatterns = [
     path('', home, name='home'),  # Root URL test
     path('admin/', admin.site.urls),
-    path("webhook/", dialogflow_webhook, name="dialogflow_webhook"),  # ✅ fixed
+    # ⚡ Under ASGI (chatbot/asgi.py) the webhook is the async view
+    path("webhook/", dialogflow_webhook_async if settings.ASYNC_WEBHOOK else dialogflow_webhook,
+         name="dialogflow_webhook"),  # ✅ fixed
+    path("webhook/async/", dialogflow_webhook_async, name="dialogflow_webhook_async"),
+    path("ready/", readiness, name="readiness"),  # 503 until the catalog warmup is done
+    path("metrics/", metrics, name="metrics"),  # 📊 latency percentiles + counters
+    path("profiles/", profiles, name="profiles"),  # 🔬 admin only
+    path("profiles/<int:profile_id>/", profile_download, name="profile_download"),
 ]
 
 
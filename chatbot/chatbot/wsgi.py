@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatbot.settings')
+# Server process: load the catalog snapshot in BotConfig.ready(), before the first request
+os.environ.setdefault('CATALOG_WARMUP_SERVER', '1')
 
 application = get_wsgi_application()